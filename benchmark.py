@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import spacy
+
+import extract_docs
+from utils import categories, signal, doc_from_annotation
+from parse_cache import ParseCache, parse_documents
+from cascade import Cascade
+
+gold_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark', 'gold_annotations.jsonl')
+
+# building blocks of the synthetic constraint sentences
+subjects = ['The operator', 'The controller', 'Each member state', 'The supplier', 'The applicant', 'Any person who receives a request']
+verbs = ['notify', 'inform', 'submit', 'review', 'approve', 'deliver', 'retain', 'not disclose']
+objects = ['the authority', 'the report', 'the documents', 'the records', 'the request', 'the personal data']
+agents = ['the auditor', 'the customer', 'the board', 'the processor', 'the committee']
+relative_verbs = ['prepared', 'received', 'approved', 'requested', 'reviewed']
+times = ['within {} days', 'no later than {} months after the request', 'at least {} weeks before the meeting']
+conditions = ['unless the contract is terminated', 'if the request is incomplete', 'where the law requires it', 'provided that consent is given']
+
+
+def synthetic_sentence(rng, depth):
+    '''constraint sentence whose object is nested depth relative clauses deep, with an optional time and condition'''
+    obj = rng.choice(objects)
+    for _ in range(depth):
+        obj = '{} which {} {} for {}'.format(rng.choice(objects), rng.choice(agents), rng.choice(relative_verbs), obj)
+    sentence = '{} {} {} {}'.format(rng.choice(subjects), rng.choice(signal), rng.choice(verbs), obj)
+    if rng.random() < 0.5:
+        sentence += ' ' + rng.choice(times).format(rng.randint(2, 30))
+    if rng.random() < 0.5:
+        sentence += ' ' + rng.choice(conditions)
+    return sentence + '.'
+
+
+def synthetic_sentences(n, max_depth=4, seed=0):
+    '''n reproducible synthetic sentences with nesting depths 0 to max_depth'''
+    rng = random.Random(seed)
+    return [synthetic_sentence(rng, i % (max_depth + 1)) for i in range(n)]
+
+
+def read_gold(path=gold_path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def latency_stats(latencies):
+    '''sentences per second and latency percentiles in ms'''
+    latencies = sorted(latencies)
+    def percentile(p):
+        return 1000 * latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+    return {'sentences': len(latencies), 'sentences_per_sec': len(latencies) / sum(latencies) if sum(latencies) else 0,
+        'p50_ms': percentile(50), 'p90_ms': percentile(90), 'p99_ms': percentile(99), 'max_ms': 1000 * latencies[-1]}
+
+
+def benchmark_phrase_spans(nlp, texts, batch_size=64):
+    '''time of the phrase_spans component alone, on docs that are already parsed'''
+    add_phrase_spans = nlp.get_pipe('phrase_spans')
+    latencies = []
+    for doc in nlp.pipe(texts, batch_size=batch_size, disable=['phrase_spans']):
+        start = time.perf_counter()
+        add_phrase_spans(doc)
+        latencies.append(time.perf_counter() - start)
+    return latency_stats(latencies)
+
+
+def benchmark_pipeline(nlp, texts):
+    '''latency of the whole model (parse and extraction) for single sentences'''
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        nlp(text)
+        latencies.append(time.perf_counter() - start)
+    return latency_stats(latencies)
+
+
+def benchmark_extract_document(nlp, texts, batch_size=64, n_process=1, cache=None, cascade=None):
+    '''throughput of extract_docs.extract_document, run in a temporary folder'''
+    directory = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        os.makedirs(os.path.join(directory, 'input'))
+        os.makedirs(os.path.join(directory, 'result'))
+        with open(os.path.join(directory, 'input', 'benchmark.jsonl'), 'w') as f:
+            for i, text in enumerate(texts):
+                f.write(json.dumps({'id': 'bench_{}'.format(i), 'text': text}) + '\n')
+        os.chdir(directory)
+        extract_docs.nlp = nlp
+        start = time.perf_counter()
+        extract_docs.extract_document('benchmark', 'bench', batch_size, n_process, cache, cascade=cascade)
+        seconds = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+    return {'sentences': len(texts), 'seconds': seconds, 'sentences_per_sec': len(texts) / seconds if seconds else 0}
+
+
+def span_set(doc):
+    return set((span.label_, span.start_char, span.end_char) for span in doc.spans['sc'])
+
+
+def evaluate(docs, gold_docs):
+    '''span level precision, recall and F1 of each category (exact character offsets) and over all categories'''
+    counts = {category: {'tp': 0, 'fp': 0, 'fn': 0} for category in categories}
+    for doc, gold_doc in zip(docs, gold_docs):
+        predicted, gold = span_set(doc), span_set(gold_doc)
+        for label, start, end in predicted | gold:
+            counts.setdefault(label, {'tp': 0, 'fp': 0, 'fn': 0})
+        for label, start, end in predicted:
+            counts[label]['tp' if (label, start, end) in gold else 'fp'] += 1
+        for label, start, end in gold - predicted:
+            counts[label]['fn'] += 1
+    counts['ALL'] = {key: sum(count[key] for count in counts.values()) for key in ['tp', 'fp', 'fn']}
+    scores = dict()
+    for category, count in counts.items():
+        p = count['tp'] / (count['tp'] + count['fp']) if count['tp'] + count['fp'] else 0
+        r = count['tp'] / (count['tp'] + count['fn']) if count['tp'] + count['fn'] else 0
+        f = 2 * p * r / (p + r) if p + r else 0
+        scores[category] = dict(count, precision=p, recall=r, f1=f)
+    return scores
+
+
+def run_benchmark(nlp, synthetic=500, max_depth=4, seed=0, batch_size=64, n_process=1, cache=None, cascade=None):
+    gold = read_gold()
+    texts = [annotation['text'] for annotation in gold] + synthetic_sentences(synthetic, max_depth, seed)
+    if cascade is not None:
+        parsed = cascade.parse(((i, annotation['text']) for i, annotation in enumerate(gold)), batch_size, n_process, cache)
+    else:
+        parsed = parse_documents(nlp, ((i, annotation['text']) for i, annotation in enumerate(gold)), batch_size, n_process, cache)
+    docs = [doc for _, _, doc in parsed]
+    return {
+        'phrase_spans': benchmark_phrase_spans(nlp, texts, batch_size),
+        'pipeline': benchmark_pipeline(nlp, texts),
+        'extract_document': benchmark_extract_document(nlp, texts, batch_size, n_process, cache, cascade),
+        'accuracy': evaluate(docs, [doc_from_annotation(nlp.vocab, annotation) for annotation in gold]),
+    }
+
+
+def summary(results):
+    lines = ['{:<18} {:>10} {:>10} {:>10} {:>10} {:>10}'.format('speed', 'sent/s', 'p50 [ms]', 'p90 [ms]', 'p99 [ms]', 'max [ms]')]
+    for name in ['phrase_spans', 'pipeline']:
+        stats = results[name]
+        lines.append('{:<18} {:>10.1f} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}'.format(name, stats['sentences_per_sec'], stats['p50_ms'], stats['p90_ms'], stats['p99_ms'], stats['max_ms']))
+    lines.append('{:<18} {:>10.1f}'.format('extract_document', results['extract_document']['sentences_per_sec']))
+    lines.append('')
+    lines.append('{:<18} {:>10} {:>10} {:>10} {:>10}'.format('accuracy', 'precision', 'recall', 'f1', 'gold'))
+    for category, scores in results['accuracy'].items():
+        lines.append('{:<18} {:>10.3f} {:>10.3f} {:>10.3f} {:>10}'.format(category, scores['precision'], scores['recall'], scores['f1'], scores['tp'] + scores['fn']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures the speed and the span accuracy (against benchmark/gold_annotations.jsonl) of a model.')
+    parser.add_argument('model', help='path to the spacy model with the phrase_spans component')
+    parser.add_argument('--synthetic', type=int, default=500, help='number of synthetic sentences for the speed measurements')
+    parser.add_argument('--max-depth', type=int, default=4, help='maximum number of nested relative clauses in the synthetic sentences')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the synthetic sentences')
+    parser.add_argument('--batch-size', type=int, default=64, help='number of sentences the model parses at once')
+    parser.add_argument('--n-process', type=int, default=1, help='number of processes that parse in parallel')
+    parser.add_argument('--cache-dir', help='parse cache folder, as in extract_docs.py')
+    parser.add_argument('--cascade', metavar='CHEAP_MODEL', help='cheap model for the cascade, as in extract_docs.py')
+    parser.add_argument('--output', help='json file to save the results to')
+    args = parser.parse_args()
+    nlp = spacy.load(args.model)
+    cache = ParseCache(os.path.abspath(args.cache_dir)) if args.cache_dir else None
+    cascade = Cascade(spacy.load(args.cascade), nlp) if args.cascade else None
+    results = run_benchmark(nlp, args.synthetic, args.max_depth, args.seed, args.batch_size, args.n_process, cache, cascade)
+    if cache is not None:
+        cache.save()
+    if cascade is not None:
+        results['cascade'] = {'total': cascade.total, 'escalated': cascade.escalated}
+        print(cascade.report())
+    print(summary(results))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
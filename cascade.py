@@ -0,0 +1,49 @@
+from utils import signal, find_root, sentences_of, get_extracted_sents
+from parse_cache import parse_documents
+from pipeline import in_order
+
+
+def needs_full_model(doc):
+    '''heuristics for an extraction of the cheap model that should not be trusted:
+    a sentence without ROOT verb, no SUBJECT or VERB span, or a signal word in a sentence that was not extracted as SIGNAL'''
+    roots = [find_root(sent) for sent in sentences_of(doc)]
+    if not roots or any(root is None or root.pos_ not in ['VERB', 'AUX'] for root in roots):
+        return True
+    labels = set(span.label_ for span in doc.spans['sc'])
+    if 'SUBJECT' not in labels or 'VERB' not in labels:
+        return True
+    for root, extracted in zip(roots, get_extracted_sents(doc)):
+        signal_words = [t.text.lower() for t in root.sent if t.text.lower() in signal]
+        if len(signal_words) > 0 and extracted.signal_word.as_str().strip() not in signal_words:
+            return True
+    return False
+
+
+# Cascade extracts with a cheap model first and only parses the sentences again with the full model where needs_full_model
+class Cascade:
+    def __init__(self, cheap_nlp, nlp):
+        '''cheap_nlp, nlp: models with the same merge_noun_chunks, merge_entities and phrase_spans components, e.g. based on en_core_web_sm and en_core_web_trf'''
+        self.cheap_nlp = cheap_nlp
+        self.nlp = nlp
+        self.total = 0
+        self.escalated = 0
+
+    def parse(self, sentences, batch_size=64, n_process=1, cache=None, scheduler=None, extract=True):
+        '''same as parse_documents, but only the escalated sentences are parsed by the full model;
+        with extract=False only the full model leaves out phrase_spans, the cheap model needs its spans for needs_full_model'''
+        def accepted(parsed):
+            '''the doc of the cheap model, or None if the sentence is escalated to the full model'''
+            self.total += 1
+            if needs_full_model(parsed[2]):
+                self.escalated += 1
+                return None
+            return parsed[2]
+        def parse_escalated(escalated):
+            return parse_documents(self.nlp, ((id, sentence) for id, sentence, _ in escalated), batch_size, n_process, cache, scheduler, extract)
+        cheap_parses = parse_documents(self.cheap_nlp, sentences, batch_size, n_process, cache, scheduler)
+        for (id, sentence, doc), result, escalated in in_order(cheap_parses, accepted, parse_escalated):
+            yield result if escalated else (id, sentence, doc)
+
+    def report(self):
+        share = self.escalated / self.total if self.total else 0
+        return 'Escalated {} of {} sentences ({:.1%}) to the full model.'.format(self.escalated, self.total, share)
@@ -0,0 +1,64 @@
+import csv
+import json
+import os
+import re
+
+# file types that hold a whole corpus, checked in this order when looking for input/<name>.<extension>
+corpus_extensions = ['.jsonl', '.csv', '.txt']
+
+
+def find_corpus(directory, name):
+    '''path of the corpus called name in directory: either the folder directory/name or a single directory/name.jsonl, .csv or .txt file'''
+    path = os.path.join(directory, name)
+    if os.path.isdir(path):
+        return path
+    for extension in corpus_extensions:
+        if os.path.isfile(path + extension):
+            return path + extension
+    return None
+
+
+def read_sentences(path):
+    '''
+    lazily reads the sentences of a corpus as (id, sentence) pairs
+    Input: a folder of .txt files (each a sentence, the file name is the id),
+    a .jsonl file with one {"id": ..., "text": ...} object per line,
+    a .csv file with the columns id and text,
+    or a .txt file with one sentence per line (the id is the file name and line number)
+    '''
+    if os.path.isdir(path):
+        return read_txt_folder(path)
+    if path.endswith('.jsonl'):
+        return read_jsonl(path)
+    if path.endswith('.csv'):
+        return read_csv(path)
+    return read_lines(path)
+
+
+def read_txt_folder(directory):
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.txt'):
+            with open(entry.path, 'r') as f:
+                yield re.sub(r'\.txt$', '', entry.name), f.read()
+
+
+def read_jsonl(path):
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f):
+            if line.strip():
+                record = json.loads(line)
+                yield str(record.get('id', line_number)), record.get('text', record.get('sentence'))
+
+
+def read_csv(path):
+    with open(path, 'r', newline='') as f:
+        for line_number, record in enumerate(csv.DictReader(f)):
+            yield str(record.get('id', line_number)), record.get('text', record.get('sentence'))
+
+
+def read_lines(path):
+    name = re.sub(r'\.txt$', '', os.path.basename(path))
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f):
+            if line.strip():
+                yield '{}_{}'.format(name, line_number), line.rstrip('\n')
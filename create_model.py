@@ -1,12 +1,79 @@
 import spacy
+import argparse
 from phrase_extraction import *
 
+profiles = ['full', 'minimal']
+# components that create_model adds, they run after the pretrained components in this order
+extraction_components = ['merge_noun_chunks', 'merge_entities', 'phrase_spans']
+
+
+def needed_components(nlp):
+    '''
+    names of the pretrained components of nlp that the extraction components need, found backwards from their requires;
+    a component is kept if it assigns a needed attribute, if a kept component listens to it (tok2vec, transformer)
+    or if it does not declare what it assigns (e.g. the attribute_ruler that maps the tags to token.pos)
+    '''
+    needed_attributes = set()
+    for name in extraction_components:
+        needed_attributes.update(Language.get_factory_meta(name).requires)
+    kept = set()
+    for name, proc in reversed(nlp.pipeline):
+        assigns = nlp.get_pipe_meta(name).assigns
+        listeners = getattr(proc, 'listener_map', dict())
+        if not assigns or needed_attributes.intersection(assigns) or kept.intersection(listeners):
+            kept.add(name)
+            needed_attributes.update(nlp.get_pipe_meta(name).requires)
+    return [name for name in nlp.pipe_names if name in kept]
+
+
+def add_extraction_components(nlp):
+    for name in extraction_components:
+        nlp.add_pipe(name)
+    return nlp
+
+
+def different_spans(nlp, minimal_nlp, texts):
+    '''texts for which the spans of both models differ'''
+    from benchmark import span_set
+    return [doc.text for doc, minimal_doc in zip(nlp.pipe(texts), minimal_nlp.pipe(texts)) if span_set(doc) != span_set(minimal_doc)]
+
+
+def create_model(base_model, path, profile='full'):
+    '''
+    adds the phrase_spans component (and the merges it relies on) to a pretrained pipeline and saves it to path;
+    with the minimal profile, the pretrained components that the extraction does not need (e.g. the lemmatizer) are left out,
+    if the spans of the benchmark sentences are identical to the ones of the full pipeline
+    '''
+    nlp = add_extraction_components(spacy.load(base_model))
+    if profile == 'minimal':
+        from benchmark import read_gold, synthetic_sentences
+        base_nlp = spacy.load(base_model)
+        kept = needed_components(base_nlp)
+        excluded = [name for name in base_nlp.component_names if name not in kept]
+        minimal_nlp = add_extraction_components(spacy.load(base_model, exclude=excluded))
+        texts = [annotation['text'] for annotation in read_gold()] + synthetic_sentences(200)
+        different = different_spans(nlp, minimal_nlp, texts)
+        if different:
+            print('The minimal pipeline extracts other spans for {} of {} benchmark sentences, e.g. "{}". Saving the full pipeline instead.'.format(len(different), len(texts), different[0]))
+        else:
+            print('Left out {} (identical spans for {} benchmark sentences).'.format(', '.join(excluded) or 'nothing', len(texts)))
+            nlp = minimal_nlp
+    nlp.to_disk(path)
+    return nlp
+
+
 # Create and save model with phrase_spans component - only needs to run once
-nlp = spacy.load('en_core_web_trf')
-nlp.add_pipe('merge_noun_chunks')
-nlp.add_pipe('merge_entities')
-nlp.add_pipe('phrase_spans')
-nlp.to_disk('./models/method_a')
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Creates the models with the phrase_spans component.')
+    parser.add_argument('--base-model', default='en_core_web_trf', help='pretrained spaCy pipeline to build on')
+    parser.add_argument('--path', default='./models/method_a', help='where to save the model')
+    parser.add_argument('--profile', choices=profiles, default='full', help='minimal leaves out the pretrained components that the extraction does not need, if the spans stay identical')
+    parser.add_argument('--cascade-base-model', help='also create a cheap model for extract_docs.py --cascade, e.g. en_core_web_sm')
+    parser.add_argument('--cascade-path', default='./models/method_a_sm', help='where to save the cheap model')
+    args = parser.parse_args()
+    create_model(args.base_model, args.path, args.profile)
+    if args.cascade_base_model:
+        create_model(args.cascade_base_model, args.cascade_path, args.profile)
 
 # Afterwards, to use the above model with pipeline, simply load the previously saved model
-# nlp = spacy.load('models/method_a')
\ No newline at end of file
+# nlp = spacy.load('models/method_a')
@@ -0,0 +1,86 @@
+import re
+from threading import Lock
+
+from pipeline import in_order
+
+dedup_modes = ['exact', 'whitespace', 'case']
+
+
+# Deduplicator parses each unique sentence only once, also across documents, and gives its doc to every id with that sentence
+class Deduplicator:
+    def __init__(self, whitespace=True, case=False):
+        '''
+        whitespace: sentences that only differ in whitespace are the same;
+        case: sentences that only differ in upper and lower case are the same, they get the doc of the first one
+        '''
+        self.whitespace = whitespace
+        self.case = case
+        self.counts = dict() # key -> number of sentences with this key that are not extracted yet, see count
+        self.docs = dict() # key -> parsed doc, until all sentences with this key are extracted
+        self.used_up = set() # keys whose counted sentences are all extracted, a late parse of them (from another document) is not kept
+        self.lock = Lock() # the documents can be extracted in parallel threads, see extract_docs.py --workers
+        self.total = 0
+        self.parsed = 0
+
+    @classmethod
+    def from_mode(cls, mode):
+        '''mode: one of dedup_modes'''
+        if mode not in dedup_modes:
+            raise ValueError('Unknown dedup mode {}, use one of {}.'.format(mode, ', '.join(dedup_modes)))
+        return cls(whitespace=mode != 'exact', case=mode == 'case')
+
+    def key(self, sentence):
+        if self.whitespace:
+            sentence = re.sub(r'\s+', ' ', sentence).strip()
+        if self.case:
+            sentence = sentence.lower()
+        return sentence
+
+    def count(self, sentences):
+        '''counts the sentences (id, sentence) of a document in advance, so that each doc is dropped after its last use'''
+        for _, sentence in sentences:
+            key = self.key(sentence)
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def use(self, key):
+        with self.lock:
+            doc = self.docs[key]
+            if key in self.counts:
+                self.counts[key] -= 1
+                if self.counts[key] <= 0:
+                    del self.counts[key]
+                    del self.docs[key]
+                    self.used_up.add(key)
+        return doc
+
+    def parse(self, sentences, parse):
+        '''
+        same as parse(sentences), but only the first sentence of each key is parsed;
+        parse: function that yields (id, sentence, doc) of an iterable of (id, sentence), in their order
+        '''
+        parsing = set() # keys that are parsed but not back yet
+        def duplicate(item):
+            '''the key of a sentence whose doc is parsed already (or on its way), None for the first sentence of a key'''
+            key = self.key(item[1])
+            with self.lock:
+                self.total += 1
+                if key in self.docs or key in parsing:
+                    return key
+                self.parsed += 1
+                self.used_up.discard(key)
+            parsing.add(key)
+            return None
+        for (id, sentence), result, parsed in in_order(sentences, duplicate, parse):
+            if parsed:
+                key = self.key(sentence)
+                with self.lock:
+                    if key not in self.used_up:
+                        self.docs[key] = result[2]
+                parsing.discard(key)
+            else:
+                key = result
+            yield id, sentence, self.use(key)
+
+    def report(self):
+        share = 1 - self.parsed / self.total if self.total else 0
+        return 'Parsed {} unique of {} sentences, {:.1%} were duplicates.'.format(self.parsed, self.total, share)
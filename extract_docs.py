@@ -1,86 +1,218 @@
 import spacy
-import sys
+import argparse
 import os
-import re
+from threading import Event, Lock
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 from string import punctuation, whitespace
-import pandas as pd
-from spacy import displacy
 from phrase_extraction import *
+from parse_cache import ParseCache, parse_documents
+from corpus import find_corpus, read_sentences
+from result_writer import ResultWriter, output_formats
+from cascade import Cascade
+from manifest import Manifest, extraction_version
+from dedup import Deduplicator, dedup_modes
+from scheduler import LengthScheduler
+from pipeline import SharedParser, threaded, ordered_map
+from spacy.util import is_package
+import instrumentation
+from instrumentation import Profiler, timed
 
 
 
-def extract_document(folder_name, doc_name):
-  # read all .txt files from the input folder
-  input_path = 'input/' + folder_name
-  documents = read_documents(input_path)
-  result_df = pd.DataFrame()
-  # extract each sentence and save in results folder
-  for file in documents:
-    sentence = documents[file]
-    doc = nlp(sentence)
-    all_spans = doc.spans['sc']
-    spans_dict = dict()
-    for label, spans in groupby(all_spans, lambda span: span.label_):
-        # merge all spans of one category into one string
-        merged = ' '.join([span.text.strip(punctuation + whitespace) for span in spans])
-        spans_dict[label] = merged
-    # output df with extracted spans
-    df = pd.DataFrame(
-          {
-              "EXTRACTED": [sentence] + [spans_dict.get(category, '') for category in categories],
-          },
-          index = ['SENTENCE'] + categories
-      )
-    # transpose, add negation column
-    df_out = df.transpose()
-    df_out["{}_no_neg".format(doc_name)] = df_out.apply(lambda row : get_number_of_negations_in_sentence(row['VERB']), axis = 1)
-    result_df = pd.concat([result_df, df_out])
-  # change names of dfs
-  result_df.columns = result_df.columns.str.replace('SENTENCE', '{}_original_sentence'.format(doc_name))
-  result_df.columns = result_df.columns.str.replace('SUBJECT', '{}_sub'.format(doc_name))
-  result_df.columns = result_df.columns.str.replace('VERB', '{}_verb'.format(doc_name))
-  result_df.columns = result_df.columns.str.replace('TIME', '{}_time'.format(doc_name))
-  result_df.columns = result_df.columns.str.replace('CONDITION', '{}_cond'.format(doc_name))
-  result_df.columns = result_df.columns.str.replace('OBJECT', '{}_obj'.format(doc_name))
-  out_name = f'{folder_name}.xlsx'
-  out_path = 'result/' + out_name  
-  pd.DataFrame(result_df).to_excel(out_path) 
-
-
-def read_documents(directory): 
-  '''reads in txts of regulatory and realization documents
-  Input: multiple .txt files (each a sentence)
-  Output: dictionary with file name as key and its content as value'''
-  doc_dict = dict()
-  files = os.listdir(directory)
-  try:
-    for fi in files:
-        if fi.endswith('.txt'):
-          with open(directory+'/'+fi,'r') as f:
-              doc_dict[re.sub('\.txt', '', fi)] = f.read()
-  except FileNotFoundError:
+def extract_document(folder_name, doc_name, batch_size=64, n_process=1, cache=None, output_format='csv', excel=False, cascade=None, manifest=None, dedup=None, scheduler=None, parser=None, workers=0):
+  # stream the sentences of the input folder (or input/<folder_name>.jsonl, .csv, .txt)
+  input_path = find_corpus('input', folder_name)
+  if input_path is None:
     print("Wrong file or file path to dir.")
     quit()
-  return doc_dict
+  columns = result_columns(doc_name)
+  writer = ResultWriter('result/' + folder_name, columns, output_format)
+  sentences = read_sentences(input_path)
+  stopped = Event() # stops the reading thread if the document fails
+  if workers:
+    # read in a thread of its own, parse in the thread of the parser and extract the rows in a pool of workers threads
+    sentences = threaded(sentences, stopped=stopped)
+  def parse(sentences):
+    if parser is not None:
+      return parser.parse(sentences)
+    if cascade is not None:
+      return cascade.parse(sentences, batch_size, n_process, cache, scheduler)
+    return parse_documents(nlp, sentences, batch_size, n_process, cache, scheduler)
+  def extract_rows(sentences):
+    # with dedup, each unique sentence is parsed once, also across the documents
+    parsed = dedup.parse(sentences, parse) if dedup is not None else parse(sentences)
+    return ordered_map(build_row, parsed, workers) if workers else map(build_row, parsed)
+  # with a manifest (--incremental), only new or changed sentences are extracted, the rows of the others are taken from the last run
+  rows = manifest.merge(sentences, extract_rows) if manifest is not None else extract_rows(sentences)
+  # append each row to the results file
+  try:
+    for file, sentence, row in rows:
+      with timed('write results'):
+        writer.write(file, row)
+  finally:
+    stopped.set()
+    if parser is not None:
+      parser.finish()
+  with timed('write results'):
+    writer.close()
+  if manifest is not None:
+    manifest.save()
+    print(manifest.report())
+  if excel:
+    with timed('excel conversion'):
+      writer.to_excel()
 
 
-def get_number_of_negations_in_sentence(text):
-    '''extracts the number of explicit negations from a sentence'''
-    no_negations = 0
-    doc = nlp(text)
-    for token in doc:   
-        if (token.dep_ == 'neg'):
-            no_negations =+ 1
-    return no_negations
+def build_row(parsed):
+  '''(id, sentence, row) of a parsed (id, sentence, doc)'''
+  file, sentence, doc = parsed
+  with timed('build rows'):
+    extract_spans(doc)
+    texts = span_texts(doc, punctuation + whitespace)
+    # output row with the sentence, extracted spans (merged into one string per category) and number of negations
+    row = [sentence] + [' '.join(texts[category]) for category in categories] + [get_number_of_negations_in_sentence(doc)]
+  return file, sentence, row
 
 
-if __name__ == '__main__':
-  # load the previously saved model:
-  if len(sys.argv) != 2:
-    print("Wrong number of arguments. Please specify the path to spacy model that will extract the spans.")
+# a doc can be shared by several ids (with dedup), the lock makes sure that only one worker extracts it
+extraction_locks = [Lock() for _ in range(64)]
+
+def extract_spans(doc):
+  '''runs phrase_spans on a doc that was parsed without it (parse_documents with extract=False)'''
+  with extraction_locks[id(doc) % len(extraction_locks)]:
+    if doc._.extracted_sents is None:
+      phrase_spans(doc)
+
+
+def result_columns(doc_name):
+  '''column names of the result file, e.g. SUBJECT becomes rea_sub and OP_SUBJECT becomes OP_rea_sub'''
+  renames = [('SENTENCE', 'original_sentence'), ('SUBJECT', 'sub'), ('VERB', 'verb'), ('TIME', 'time'), ('CONDITION', 'cond'), ('OBJECT', 'obj')]
+  columns = []
+  for column in ['SENTENCE'] + categories:
+    for old, new in renames:
+      column = column.replace(old, '{}_{}'.format(doc_name, new))
+    columns.append(column)
+  return columns + ['{}_no_neg'.format(doc_name)]
+
+
+def get_number_of_negations_in_sentence(doc):
+    '''extracts the number of explicit negations in the verb spans of an already extracted sentence'''
+    return count_deps_in_category(doc, 'VERB', ['neg'])
+
+
+# the functions that turn a parsed doc into a row, a change to them makes --incremental extract everything again
+row_functions = [build_row, extract_spans, span_texts, get_number_of_negations_in_sentence, count_deps_in_category, tokens_in_category, tokens_with_dep]
+
+
+def document_manifest(folder_name, doc_name, output_format='csv', cascade=None):
+  '''Manifest of the last run of a document, for --incremental'''
+  version = extraction_version(nlp, result_columns(doc_name), cascade, row_functions)
+  return Manifest('result/{}.manifest.json'.format(folder_name), version, 'result/{}.{}'.format(folder_name, output_format))
+
+
+# input folder (or file) and short name of each document
+documents = [('realization_document', 'rea'), ('regulatory_document', 'reg')]
+
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(description='Extracts the constraint phrases of the realization and regulatory documents.')
+  parser.add_argument('model', help='path to the spacy model that will extract the spans')
+  parser.add_argument('--batch-size', type=int, default=64, help='number of sentences the model parses at once')
+  parser.add_argument('--n-process', type=int, default=1, help='number of processes that parse in parallel')
+  parser.add_argument('--token-budget', type=int, help='parse sentences of similar length together, in batches of at most this many (padded) words and --batch-size sentences')
+  parser.add_argument('--sort-window', type=int, default=2048, help='number of sentences that are read ahead and sorted by length for --token-budget')
+  parser.add_argument('--cache-dir', help='folder to keep the parsed sentences in, so that later runs only redo the extraction')
+  parser.add_argument('--cache-size', type=int, default=2048, help='maximum size of the parse cache in MB')
+  parser.add_argument('--output-format', choices=output_formats, default='csv', help='file format of the results, rows are written while the sentences are extracted')
+  parser.add_argument('--excel', action='store_true', help='also convert the results into .xlsx files at the end')
+  parser.add_argument('--cascade', metavar='CHEAP_MODEL', help='path to a cheaper model (e.g. models/method_a_sm) that extracts first, only sentences with a doubtful result are parsed again by model')
+  parser.add_argument('--incremental', action='store_true', help='only extract new or changed sentences and reuse the other rows of the last run (see result/<document>.manifest.json)')
+  parser.add_argument('--dedup', choices=dedup_modes, help='parse sentences that occur several times (in both documents) only once: exact copies, copies that only differ in whitespace, or also in case')
+  parser.add_argument('--workers', type=int, default=0, help='run reading, parsing, extraction (in this many threads) and writing of both documents at the same time')
+  parser.add_argument('--profile', metavar='REPORT', help='record time, calls and memory of every stage, component and extraction function and save them to the json file REPORT')
+  args = parser.parse_args(argv)
+  # check the arguments before the model is loaded
+  if args.token_budget and args.n_process != 1:
+    parser.error('--token-budget only works with --n-process 1, with several processes nlp.pipe only takes --batch-size')
+  for model in [args.model, args.cascade]:
+    if model is not None and not os.path.exists(model) and not is_package(model):
+      parser.error('model {} not found'.format(model))
+  return args
+
+
+def has_sentences(input_path):
+  return next(iter(read_sentences(input_path)), None) is not None
+
+
+def main(argv=None):
+  global nlp
+  args = parse_args(argv)
+  input_paths = [find_corpus('input', folder_name) for folder_name, _ in documents]
+  if None in input_paths:
+    print("Wrong file or file path to dir.")
     quit()
-  nlp = spacy.load(sys.argv[1])
+  if not any(has_sentences(input_path) for input_path in input_paths):
+    # nothing to extract, only write the empty result files, without loading the model
+    for folder_name, doc_name in documents:
+      writer = ResultWriter('result/' + folder_name, result_columns(doc_name), args.output_format)
+      writer.close()
+      if args.excel:
+        writer.to_excel()
+    return
+  if args.profile:
+    instrumentation.profiler = Profiler()
+  # load the previously saved model:
+  with timed('load model'):
+    nlp = spacy.load(args.model)
+    cascade = Cascade(spacy.load(args.cascade), nlp) if args.cascade else None
+  cache = ParseCache(args.cache_dir, max_bytes=args.cache_size * 1024 ** 2) if args.cache_dir else None
+  if args.profile:
+    instrumentation.profiler.instrument_functions()
+    instrumentation.profiler.instrument_pipeline(nlp)
+    if cascade is not None:
+      instrumentation.profiler.instrument_pipeline(cascade.cheap_nlp, 'cheap component')
+
+  dedup = Deduplicator.from_mode(args.dedup) if args.dedup else None
+  scheduler = LengthScheduler(args.token_budget, args.sort_window) if args.token_budget else None
+  manifests = [document_manifest(folder_name, doc_name, args.output_format, cascade) if args.incremental else None for folder_name, doc_name in documents]
+  if dedup is not None:
+    # only the sentences that are parsed are counted, with --incremental the reused ones would never use up their count
+    for input_path, manifest in zip(input_paths, manifests):
+      sentences = read_sentences(input_path)
+      dedup.count(manifest.changed(sentences) if manifest is not None else sentences)
 
-  # extract each document from the input folder and save it as html in result folder
-  extract_document('realization_document', 'rea')
-  extract_document('regulatory_document', 'reg')
+  # extract each document from the input folder and save it in the result folder
+  if args.workers:
+    # one thread parses the sentences of both documents, the phrase spans are added by the workers of each document
+    def parse(sentences):
+      if cascade is not None:
+        return cascade.parse(sentences, args.batch_size, args.n_process, cache, scheduler, extract=False)
+      return parse_documents(nlp, sentences, args.batch_size, args.n_process, cache, scheduler, extract=False)
+    shared_parser = SharedParser(parse, len(documents))
+    with ThreadPoolExecutor(len(documents)) as executor:
+      futures = [executor.submit(extract_document, folder_name, doc_name, args.batch_size, args.n_process, cache, args.output_format, args.excel, cascade, manifest, dedup, scheduler, shared_parser, args.workers)
+        for (folder_name, doc_name), manifest in zip(documents, manifests)]
+      wait(futures, return_when=FIRST_EXCEPTION)
+      failed = [future for future in futures if future.done() and future.exception() is not None]
+      if failed:
+        # stop the other document instead of waiting for it, it would wait for parses that the failed document no longer reads
+        shared_parser.cancel()
+        raise failed[0].exception()
+  else:
+    for (folder_name, doc_name), manifest in zip(documents, manifests):
+      extract_document(folder_name, doc_name, args.batch_size, args.n_process, cache, args.output_format, args.excel, cascade, manifest, dedup, scheduler)
+  if cache is not None:
+    cache.save()
+  if dedup is not None:
+    print(dedup.report())
+  if scheduler is not None:
+    print(scheduler.report())
+  if cascade is not None:
+    print(cascade.report())
+  if args.profile:
+    instrumentation.profiler.save(args.profile)
+    print(instrumentation.profiler.summary())
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,140 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from itertools import islice
+try:
+    import resource
+except ImportError: # not available on Windows, memory is then not reported
+    resource = None
+
+# the Profiler of the current run, or None if the run is not instrumented
+profiler = None
+
+
+def timed(name):
+    '''context manager that records the time of a stage in the active profiler (and does nothing without one)'''
+    return profiler.timed(name) if profiler is not None else nullcontext()
+
+
+def max_rss_mb(who=None):
+    '''memory high-water mark of this process (or its finished child processes) in MB'''
+    if resource is None:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024 # bytes on macOS, kB on Linux
+
+
+# Profiler records wall time, CPU time, number of calls and memory high-water mark of pipeline components, functions and stages;
+# the stages can run in several threads at once (extract_docs.py --workers), then their wall times add up to more than the run
+class Profiler:
+    def __init__(self):
+        self.stats = dict() # name -> {'calls', 'wall', 'cpu', 'max_rss_mb'}
+        self.lock = threading.Lock() # for stats, which the threads share
+        self.local = threading.local() # active: name -> number of unfinished calls in this thread, recursive calls are only timed once
+        self.patched = [] # (owner, attribute, original) to undo the instrumentation
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    @contextmanager
+    def timed(self, name):
+        '''records a call of name; its CPU time is that of the calling thread (time.process_time would count all threads)'''
+        active = self.local.__dict__.setdefault('active', dict())
+        outermost = active.get(name, 0) == 0
+        active[name] = active.get(name, 0) + 1
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            active[name] -= 1
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            rss = max_rss_mb()
+            with self.lock:
+                stat = self.stats.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'max_rss_mb': 0.0})
+                stat['calls'] += 1
+                if outermost:
+                    stat['wall'] += wall
+                    stat['cpu'] += cpu
+                    stat['max_rss_mb'] = max(stat['max_rss_mb'], rss)
+
+    def wrap(self, owner, attribute, name):
+        '''replaces the function or method owner.attribute by a version that is timed as name'''
+        original = getattr(owner, attribute)
+        @wraps(original)
+        def timed_function(*args, **kwargs):
+            with self.timed(name):
+                return original(*args, **kwargs)
+        setattr(owner, attribute, timed_function)
+        self.patched.append((owner, attribute, original))
+
+    def instrument_functions(self):
+        '''times the main functions of the phrase extraction'''
+        import utils
+        import phrase_extraction
+        for function in ['extract', 'extract_clause', 'find_verb_deco', 'find_times_conds']:
+            self.wrap(phrase_extraction, function, 'phrase_extraction.' + function)
+        self.wrap(utils, 'expand_subtree', 'utils.expand_subtree')
+        self.wrap(utils.Phrase, '__init__', 'utils.Phrase()')
+        self.wrap(utils.Phrase, 'get_children', 'utils.Phrase.get_children')
+        self.wrap(utils.Extracted, 'as_span', 'utils.Extracted.as_span')
+
+    def instrument_pipeline(self, nlp, prefix='component'):
+        '''times the tokenizer and each component of nlp when the docs are parsed with nlp.pipe'''
+        pipe = nlp.pipe
+        def timed_pipe(texts, batch_size=None, n_process=1, disable=[], **kwargs):
+            if n_process != 1 or kwargs: # the components run in other processes, time the pipeline as a whole
+                docs = pipe(texts, batch_size=batch_size, n_process=n_process, disable=disable, **kwargs)
+                while True:
+                    with self.timed(prefix + 's: nlp.pipe'):
+                        doc = next(docs, None)
+                    if doc is None:
+                        return
+                    yield doc
+            texts = iter(texts)
+            while True:
+                batch = list(islice(texts, batch_size or nlp.batch_size))
+                if not batch:
+                    return
+                with self.timed(prefix + ': tokenizer'):
+                    docs = [nlp.make_doc(text) for text in batch]
+                for name, proc in nlp.pipeline:
+                    if name in disable:
+                        continue
+                    with self.timed(prefix + ': ' + name):
+                        docs = list(proc.pipe(docs, batch_size=len(docs))) if hasattr(proc, 'pipe') else [proc(doc) for doc in docs]
+                yield from docs
+        nlp.pipe = timed_pipe
+        self.patched.append((nlp, 'pipe', pipe))
+
+    def restore(self):
+        for owner, attribute, original in reversed(self.patched):
+            setattr(owner, attribute, original)
+        self.patched = []
+
+    def report(self):
+        with self.lock:
+            stats = {name: dict(stat) for name, stat in self.stats.items()}
+        return {
+            'wall': time.perf_counter() - self.wall,
+            'cpu': time.process_time() - self.cpu, # all threads of the process
+            'max_rss_mb': max_rss_mb(),
+            'max_rss_children_mb': max_rss_mb(resource.RUSAGE_CHILDREN) if resource is not None else 0.0,
+            'stats': stats,
+        }
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def summary(self):
+        '''table of all timed names, slowest first'''
+        report = self.report()
+        lines = ['{:<40} {:>10} {:>10} {:>10} {:>7} {:>12}'.format('name', 'calls', 'wall [s]', 'cpu [s]', 'wall %', 'max rss [MB]')]
+        for name, stat in sorted(report['stats'].items(), key=lambda item: -item[1]['wall']):
+            share = stat['wall'] / report['wall'] if report['wall'] else 0
+            lines.append('{:<40} {:>10} {:>10.3f} {:>10.3f} {:>7.1%} {:>12.1f}'.format(name, stat['calls'], stat['wall'], stat['cpu'], share, stat['max_rss_mb']))
+        lines.append('total wall {:.3f} s, cpu {:.3f} s, max rss {:.1f} MB (child processes {:.1f} MB)'.format(
+            report['wall'], report['cpu'], report['max_rss_mb'], report['max_rss_children_mb']))
+        return '\n'.join(lines)
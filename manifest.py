@@ -0,0 +1,116 @@
+import hashlib
+import inspect
+import json
+import os
+
+import utils
+import phrase_extraction
+from parse_cache import model_fingerprint
+from pipeline import in_order
+from result_writer import read_results
+
+
+def rules_hash():
+    '''hash of the extraction rules: the dependency lists of phrase_extraction.py, the trigger lists of utils.py and the code of both modules'''
+    rules = []
+    for module in [phrase_extraction, utils]:
+        lists = {name: value for name, value in vars(module).items() if isinstance(value, list) and all(isinstance(v, str) for v in value)}
+        rules.append(json.dumps(lists, sort_keys=True))
+        rules.append(inspect.getsource(module))
+    return hashlib.sha1('\n'.join(rules).encode('utf8')).hexdigest()
+
+
+def extraction_version(nlp, columns, cascade=None, row_functions=()):
+    '''hash of everything a result row depends on besides its sentence: the rules, the model(s), the result columns and
+    the code of row_functions, the functions that build the rows (e.g. extract_docs.build_row)'''
+    models = [model_fingerprint(nlp)] + ([model_fingerprint(cascade.cheap_nlp)] if cascade is not None else [])
+    version = '\n'.join([rules_hash()] + models + columns + [inspect.getsource(function) for function in row_functions])
+    return hashlib.sha1(version.encode('utf8')).hexdigest()
+
+
+def content_hash(sentence):
+    return hashlib.sha1(sentence.encode('utf8')).hexdigest()
+
+
+# Manifest remembers the content hash of every sentence of a previous run, so that a rerun only extracts new or changed sentences
+# and reads the rows of the others back from the result file of the previous run
+class Manifest:
+    def __init__(self, path, version, results_path):
+        '''
+        path: json file of the manifest, e.g. result/realization_document.manifest.json;
+        version: extraction_version of this run, the rows of a run with other rules, models or columns are not reused;
+        results_path: result file of the previous run (ResultWriter.path), this run writes a temporary file until it is done
+        '''
+        self.path = path
+        self.version = version
+        self.results_path = results_path
+        self.previous = dict() # id -> content hash of the previous run, for the ids with a row in its result file
+        if os.path.exists(path) and os.path.exists(results_path):
+            with open(path, 'r') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == version and manifest.get('results') == results_path:
+                # one pass over the ids of the result file, so that only sentences whose row can be read back are reused
+                ids = {id for id, _ in read_results(results_path)}
+                self.previous = {id: hash for id, hash in manifest.get('hashes', {}).items() if id in ids}
+        self.previous_rows = read_results(results_path) if self.previous else None # read along with the input
+        self.skipped = dict() # id -> row of the previous result file that was read past, because the input order changed
+        self.hashes = dict() # id -> content hash of this run, ids that are not in the input anymore are dropped
+        self.reused = 0
+        self.extracted = 0
+
+    def is_reused(self, id, sentence, seen):
+        '''the row of the previous run is reused if the sentence with this id did not change;
+        seen: ids of the sentences before this one, an id that is repeated in the input is extracted again'''
+        reused = id not in seen and self.previous.get(id) == content_hash(sentence)
+        seen.add(id)
+        return reused
+
+    def changed(self, sentences):
+        '''the (id, sentence) pairs that merge extracts, e.g. to count them for Deduplicator'''
+        seen = set()
+        return ((id, sentence) for id, sentence in sentences if not self.is_reused(id, sentence, seen))
+
+    def previous_row(self, id):
+        '''row of id in the previous result file, which is read in the order of the input as long as that did not change'''
+        if id in self.skipped:
+            return self.skipped.pop(id)
+        for row_id, row in self.previous_rows:
+            if row_id == id:
+                return row
+            if row_id in self.previous:
+                self.skipped[row_id] = row
+        raise ValueError('{} has no row for {}, rerun without --incremental.'.format(self.results_path, id))
+
+    def merge(self, sentences, extract_rows):
+        '''
+        yields (id, sentence, row) in the order of sentences, rows of unchanged sentences are read from the previous result file;
+        extract_rows: function that extracts (id, sentence, row) of an iterable of (id, sentence), in their order
+        '''
+        seen = set()
+        def reused(item):
+            return True if self.is_reused(item[0], item[1], seen) else None
+        for (id, sentence), result, extracted in in_order(sentences, reused, extract_rows):
+            if extracted:
+                self.extracted += 1
+                self.hashes[id] = content_hash(sentence)
+                yield result
+            else:
+                yield self.reuse(id, sentence)
+        if self.previous_rows is not None:
+            self.previous_rows.close()
+
+    def reuse(self, id, sentence):
+        self.reused += 1
+        self.hashes[id] = self.previous[id]
+        return id, sentence, self.previous_row(id)
+
+    def save(self):
+        # write to a temporary file first, an interrupted run keeps the previous manifest
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'version': self.version, 'results': self.results_path, 'hashes': self.hashes}, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def report(self):
+        deleted = len(set(self.previous) - set(self.hashes))
+        return '{}: extracted {} new or changed sentences, reused {} unchanged, dropped {} deleted.'.format(
+            os.path.basename(self.path), self.extracted, self.reused, deleted)
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from spacy.tokens import DocBin
+
+from pipeline import in_order
+
+
+def model_fingerprint(nlp):
+    '''hash of the model name, version and pipeline config, so that parses of another model are never reused'''
+    fingerprint = '\n'.join([nlp.meta.get('name', ''), nlp.meta.get('version', ''), nlp.config.to_str()])
+    return hashlib.sha1(fingerprint.encode('utf8')).hexdigest()
+
+
+def cache_key(fingerprint, text):
+    '''key of the parse of text by the model with this fingerprint'''
+    return hashlib.sha1((fingerprint + '\n' + text).encode('utf8')).hexdigest()
+
+
+# ParseCache keeps the parsed docs (before phrase_spans) on disk, so that changed extraction rules don't need a new parse
+class ParseCache:
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3, shard_size=1000, loaded_shards=8):
+        '''
+        directory: folder with the DocBin shards and their index.json;
+        max_bytes: the least recently used shards are deleted once all shards together are larger;
+        shard_size: number of new docs that are written together into one shard;
+        loaded_shards: number of shards that are kept in memory after reading them
+        '''
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.shard_size = shard_size
+        self.loaded_shards = loaded_shards
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, 'index.json')
+        index = {'entries': {}, 'shards': {}, 'models': {}}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        self.entries = index['entries'] # key -> [shard, position of the doc in the shard]
+        self.shards = index['shards'] # shard -> {'size': bytes on disk, 'used': time of last use}
+        self.models = index['models'] # fingerprint -> model name and version
+        self.fingerprints = dict() # id(nlp) -> fingerprint
+        self.loaded = dict() # shard -> docs, for the most recently read shards
+        self.new = dict() # key -> doc, for the docs that are not saved in a shard yet
+        self.new_docs = DocBin(store_user_data=False)
+
+    def fingerprint(self, nlp):
+        if id(nlp) not in self.fingerprints:
+            fingerprint = model_fingerprint(nlp)
+            self.fingerprints[id(nlp)] = fingerprint
+            self.models[fingerprint] = '{} {}'.format(nlp.meta.get('name', ''), nlp.meta.get('version', ''))
+        return self.fingerprints[id(nlp)]
+
+    def key(self, nlp, text):
+        return cache_key(self.fingerprint(nlp), text)
+
+    def get(self, nlp, text):
+        '''the cached parse of text by nlp, or None if it has not been cached yet'''
+        key = self.key(nlp, text)
+        if key in self.entries:
+            shard, position = self.entries[key]
+            self.shards[shard]['used'] = time.time()
+            return self.load_shard(nlp.vocab, shard)[position]
+        return self.new.get(key)
+
+    def add(self, nlp, text, doc):
+        '''caches the parse doc of text by nlp, the docs are written to disk in shards of shard_size'''
+        key = self.key(nlp, text)
+        if key in self.entries or key in self.new:
+            return
+        self.new[key] = doc
+        self.new_docs.add(doc)
+        if len(self.new) >= self.shard_size:
+            self.save()
+
+    def load_shard(self, vocab, shard):
+        if shard not in self.loaded:
+            if len(self.loaded) >= self.loaded_shards:
+                del self.loaded[next(iter(self.loaded))]
+            doc_bin = DocBin().from_disk(os.path.join(self.directory, shard + '.spacy'))
+            self.loaded[shard] = list(doc_bin.get_docs(vocab))
+        return self.loaded[shard]
+
+    def save(self):
+        '''writes the not yet saved docs as a new shard, evicts old shards and updates the index'''
+        if self.new:
+            shard = uuid.uuid4().hex
+            path = os.path.join(self.directory, shard + '.spacy')
+            self.new_docs.to_disk(path)
+            self.shards[shard] = {'size': os.path.getsize(path), 'used': time.time()}
+            for position, key in enumerate(self.new):
+                self.entries[key] = [shard, position]
+            self.new = dict()
+            self.new_docs = DocBin(store_user_data=False)
+        self.evict()
+        with open(self.index_path, 'w') as f:
+            json.dump({'entries': self.entries, 'shards': self.shards, 'models': self.models}, f)
+
+    def evict(self):
+        '''deletes the least recently used shards until all shards fit into max_bytes'''
+        total = sum(shard['size'] for shard in self.shards.values())
+        if total <= self.max_bytes:
+            return
+        evicted = set()
+        for shard in sorted(self.shards, key=lambda shard: self.shards[shard]['used']):
+            if total <= self.max_bytes:
+                break
+            total -= self.shards[shard]['size']
+            evicted.add(shard)
+            os.remove(os.path.join(self.directory, shard + '.spacy'))
+            self.loaded.pop(shard, None)
+        for shard in evicted:
+            del self.shards[shard]
+        self.entries = {key: entry for key, entry in self.entries.items() if entry[0] not in evicted}
+
+
+def parse_documents(nlp, sentences, batch_size=64, n_process=1, cache=None, scheduler=None, extract=True):
+    '''parses the sentences with nlp.pipe in batches of batch_size sentences on n_process processes,
+    sentences whose parse is found in the cache are not parsed again,
+    with a scheduler (LengthScheduler) the batches hold sentences of similar length,
+    with extract=False the phrase_spans component is left out, so that it can run elsewhere (e.g. in other threads)
+    Input: iterable of (id, sentence) pairs, which is read lazily
+    Output: generator of (id, sentence, doc) in the order of sentences'''
+    # with a cache, the model only parses and the phrase spans are added afterwards, so that the cached parses stay
+    # valid when the extraction rules change. Without one, the (worker processes of the) model extract as well
+    add_phrase_spans = nlp.get_pipe('phrase_spans') if extract else lambda doc: doc
+    disable = ['phrase_spans'] if cache is not None or not extract else []
+    def cached(item):
+        return cache.get(nlp, item[1]) if cache is not None else None
+    def parse(items):
+        texts = (sentence for _, sentence in items)
+        if scheduler is not None:
+            return scheduler.pipe(nlp, texts, batch_size, n_process, disable)
+        return nlp.pipe(texts, batch_size=batch_size, n_process=n_process, disable=disable)
+    # the cached docs between the parsed ones are held back only up to a limit, see in_order
+    for (id, sentence), doc, parsed in in_order(sentences, cached, parse):
+        if cache is not None:
+            if parsed:
+                cache.add(nlp, sentence, doc)
+            doc = add_phrase_spans(doc)
+        yield id, sentence, doc
@@ -15,19 +15,23 @@ dep_cond = ['acl', 'relcl', 'advcl', 'nmod', 'npadvmod', 'nounmod', 'advmod', 'p
 
 def find_verb_deco(root):
     # find verb (root) and its decorations, e.g. be, not, etc.
-    direct_decos = tokens_with_dep(root.children, dep_verb) + [root]
-    # decide whether the adverbial modifier is a verb or a condition
-    for token in tokens_with_dep(root.children, ['advmod']):
-        if not Phrase(token).has_trigger(condition_trigger):
-            direct_decos.append(token)   
-    direct_decos.sort(key=by_index)
-    # recursively find all of my decorations's own decorations (e.g. know not very well)
+    # all of my decorations's own decorations are found as well (e.g. know not very well), with a stack instead of recursion for long chains
     all_decos = []
-    for deco in direct_decos:
-        if deco == root:
-            all_decos.append(root)
-        else:
-            all_decos += find_verb_deco(deco)
+    stack = [(root, False)] # (token, whether its decorations are already on the stack)
+    while stack:
+        token, expanded = stack.pop()
+        if expanded:
+            all_decos.append(token)
+            continue
+        children = children_of(token)
+        direct_decos = tokens_with_dep(children, dep_verb) + [token]
+        # decide whether the adverbial modifier is a verb or a condition
+        for child in tokens_with_dep(children, ['advmod']):
+            if not subtree_has_trigger(child, condition_trigger):
+                direct_decos.append(child)
+        direct_decos.sort(key=by_index)
+        # in reverse, so that the decorations come off the stack in the order of the sentence
+        stack.extend((deco, deco == token) for deco in reversed(direct_decos))
     return all_decos
 
 
@@ -44,16 +48,15 @@ def find_times_conds(potential_cond):
     return times, conds
 
 
-def extract(root, extract_obj_recursively=True):
+def extract_clause(root):
     '''
-    extract the whole phrase, subject, signal word, verb, time, condition, and object
-    if extract_obj_recursively is True, then objects is a list of Extracted
-    if extract_obj_recursively is False, then objects is a list of Phrase
+    extract the whole phrase, subject, signal word, verb, time, condition, and object phrases of one clause,
+    objects is a list of Phrase
     '''
     # find verb phrase
     verb_phrase = Phrase(find_verb_deco(root), has_skips=True)
     # find signal word
-    signal_word = Phrase(tokens_with_dep(root.children, dep_signal))
+    signal_word = Phrase(tokens_with_dep(children_of(root), dep_signal))
     if signal_word.as_str().strip() not in signal: # not in the whitelist, add to verb instead
         verb_phrase += signal_word
         verb_phrase.tokens.sort(key=by_index)
@@ -71,86 +74,102 @@ def extract(root, extract_obj_recursively=True):
     # find conditions and time constraints
     potential_cond_roots = set(tokens_with_dep(verb_phrase_children, dep_cond)) - set(obj.root for obj in obj_phrases)
     times, conds = find_times_conds(phrases_from_roots(potential_cond_roots))
+    return Extracted(Phrase(root), subj_phrases, signal_word, verb_phrase, times, conds, obj_phrases)
 
 
+def extract(root, extract_obj_recursively=True):
+    '''
+    extract the whole phrase, subject, signal word, verb, time, condition, and object
+    if extract_obj_recursively is True, then objects is a list of Extracted
+    if extract_obj_recursively is False, then objects is a list of Phrase
+    the objects are only analysed one level deep, so extract_clause runs at most twice per object and nothing is recursive
+    '''
+    extracted = extract_clause(root)
+    if not extract_obj_recursively: # do not analyse my objects, instead just return the object phrases
+        return extracted
+    verb_phrase, times, conds = extracted.verb_phrase, extracted.times, extracted.conditions
+
     # for each objects (given their roots), extract their subj, signal, verb, conds, times, and obj
     objects = []
-    if extract_obj_recursively:
-        for obj_phrase in obj_phrases:
-            # clausal compliments we can directly extract as sentence
-            if obj_phrase.root.dep_ in ['ccomp', 'xcomp']:
-                extracted_obj = extract(obj_phrase.root, extract_obj_recursively=False)
-                # if the extracted part has no new subject, the verbs are mergeable and there's only 1 object, merge the verbs with the main and re-extract
-                extracted_signal_verb = extracted_obj.signal_word + extracted_obj.verb_phrase
-                if extracted_obj.subject_phrases == [] \
-                    and verb_phrase[-1].nbor(1) == extracted_signal_verb[0] \
-                    and len(extracted_obj.objects) == 1:
-                    verb_phrase += extracted_signal_verb
-                    times += extracted_obj.times
-                    conds += extracted_obj.conditions
-                    # extract one layer deeper to get the object's object
-                    extracted_obj = extract(extracted_obj.objects[0].root, extract_obj_recursively=False)
+    for obj_phrase in extracted.objects:
+        # clausal compliments we can directly extract as sentence
+        if obj_phrase.root.dep_ in ['ccomp', 'xcomp']:
+            extracted_obj = extract_clause(obj_phrase.root)
+            # if the extracted part has no new subject, the verbs are mergeable and there's only 1 object, merge the verbs with the main and re-extract
+            extracted_signal_verb = extracted_obj.signal_word + extracted_obj.verb_phrase
+            if extracted_obj.subject_phrases == [] \
+                and verb_phrase[-1].nbor(1) == extracted_signal_verb[0] \
+                and len(extracted_obj.objects) == 1:
+                verb_phrase += extracted_signal_verb
+                times += extracted_obj.times
+                conds += extracted_obj.conditions
+                # extract one layer deeper to get the object's object
+                extracted_obj = extract_clause(extracted_obj.objects[0].root)
+            objects.append(extracted_obj)
+
+        # non-clausal objects might still contain relative clauses (or acl) or conditions
+        else:
+            # look for a relative clause and only take the highest level clause, in case it is nested (lowest depth)
+            rel_clause = min(tokens_with_dep(obj_phrase, ['relcl', 'acl']), default=None, key=by_depth)
+            if rel_clause is not None:
+                rel_clause = Phrase(rel_clause)
+                # extract only the relative clause (not the whole object phrase!)
+                extracted_obj = extract_clause(rel_clause.root)
+                # analyze the rest of the object phrase
+                rest_of_obj_phrase = obj_phrase - rel_clause # obj phrase WITHOUT the rel clause
+                if obj_phrase.root.dep_ == 'prep': # for prepositional object phrases, remove the preposition (e.g. for)
+                    rest_of_obj_phrase -= obj_phrase.root
+                # find any potential conditions in the rest of the object phrase
+                t, c = find_times_conds(phrases_from_roots(tokens_with_dep(rest_of_obj_phrase, dep_cond)))
+                t = [phrase for phrase in t if phrase.starts_with_trigger(condition_trigger)]
+                c = [phrase for phrase in c if phrase.starts_with_trigger(condition_trigger)]
+                extracted_obj.times += t
+                extracted_obj.conditions += c
+                # find the referred noun phrase
+                ref_noun_phrase = rest_of_obj_phrase - (Phrase.merge(t) + Phrase.merge(c))
+                # find the relative word (which, who, etc.) and prepend it with the referred noun phrase
+                for phrases in [extracted_obj.subject_phrases, extracted_obj.objects]:
+                    for i, phrase in enumerate(phrases):
+                        # find the position of the first relative word in the phrase (if any)
+                        rel_index = next((i for i, t in enumerate(phrase) if subtree_has_trigger(t, relative_words)), None)
+                        if rel_index is not None:
+                            phrases[i] = Phrase(phrase[:rel_index]) + ref_noun_phrase + Phrase(phrase[rel_index:])
+                # only the relative clause was extracted, but the whole phrase should still be the whole object phrase
+                extracted_obj.whole_phrase = obj_phrase
                 objects.append(extracted_obj)
-
-            # non-clausal objects might still contain relative clauses (or acl) or conditions
             else:
-                # look for a relative clause and only take the highest level clause, in case it is nested (lowest depth)
-                rel_clause = min(tokens_with_dep(obj_phrase, ['relcl', 'acl']), default=None, key=by_depth)
-                if rel_clause is not None:
-                    rel_clause = Phrase(rel_clause)
-                    # extract only the relative clause (not the whole object phrase!)
-                    extracted_obj = extract(rel_clause.root, extract_obj_recursively=False)
-                    # analyze the rest of the object phrase
-                    rest_of_obj_phrase = obj_phrase - rel_clause # obj phrase WITHOUT the rel clause
-                    if obj_phrase.root.dep_ == 'prep': # for prepositional object phrases, remove the preposition (e.g. for)
-                        rest_of_obj_phrase -= obj_phrase.root
-                    # find any potential conditions in the rest of the object phrase
-                    t, c = find_times_conds(phrases_from_roots(tokens_with_dep(rest_of_obj_phrase, dep_cond)))
-                    t = [phrase for phrase in t if phrase.starts_with_trigger(condition_trigger)]
-                    c = [phrase for phrase in c if phrase.starts_with_trigger(condition_trigger)]
-                    extracted_obj.times += t
-                    extracted_obj.conditions += c
-                    # find the referred noun phrase
-                    ref_noun_phrase = rest_of_obj_phrase - (Phrase.merge(t) + Phrase.merge(c))
-                    # find the relative word (which, who, etc.) and prepend it with the referred noun phrase
-                    for phrases in [extracted_obj.subject_phrases, extracted_obj.objects]:
-                        for i, phrase in enumerate(phrases):
-                            # find the position of the first relative word in the phrase (if any)
-                            rel_index = next((i for i, t in enumerate(phrase) if Phrase(t).has_trigger(relative_words)), None)
-                            if rel_index is not None:
-                                phrases[i] = Phrase(phrase[:rel_index]) + ref_noun_phrase + Phrase(phrase[rel_index:])
-                    # only the relative clause was extracted, but the whole phrase should still be the whole object phrase
-                    extracted_obj.whole_phrase = obj_phrase
-                    objects.append(extracted_obj)
-                else:
-                    # no clauses found to extract, but still look for conditions and times
-                    t, c = find_times_conds(phrases_from_roots(tokens_with_dep(obj_phrase, dep_cond)))
-                    t = [phrase for phrase in t if phrase.starts_with_trigger(condition_trigger)]
-                    c = [phrase for phrase in c if phrase.starts_with_trigger(condition_trigger)]
-                    objects.append(Extracted(obj_phrase, None, None, None, t, c, None))
-    else: # do not analyse my objects, instead just return the object phrases
-        objects = obj_phrases
-    return Extracted(Phrase(root), subj_phrases, signal_word, verb_phrase, times, conds, objects)
+                # no clauses found to extract, but still look for conditions and times
+                t, c = find_times_conds(phrases_from_roots(tokens_with_dep(obj_phrase, dep_cond)))
+                t = [phrase for phrase in t if phrase.starts_with_trigger(condition_trigger)]
+                c = [phrase for phrase in c if phrase.starts_with_trigger(condition_trigger)]
+                objects.append(Extracted(obj_phrase, None, None, None, t, c, None))
+    return Extracted(Phrase(root), extracted.subject_phrases, extracted.signal_word, verb_phrase, times, conds, objects)
 
 
 def extract_sentence(doc):
-    root = find_root(doc)
-    assign_depth(root)
-    return extract(root)
+    '''extract every sentence of the doc (that has a ROOT), returns a list of Extracted'''
+    extracted_sents = []
+    for sent in sentences_of(doc):
+        root = find_root(sent)
+        if root is not None:
+            assign_depth(root)
+            extracted_sents.append(extract(root))
+    return extracted_sents
 
 # register custom extension attributes
 Doc.set_extension('extracted', default=None)
+Doc.set_extension('extracted_sents', default=None)
 Doc.set_extension('replacements', default=None)
 
 
-@Language.component('phrase_spans')
+@Language.component('phrase_spans', requires=['token.dep', 'token.head', 'doc.sents'], assigns=['doc.spans', 'doc._.extracted', 'doc._.extracted_sents'])
 def phrase_spans(doc):
-    root = find_root(doc)
-    assign_depth(root)
-    extracted = extract(root)
-    spans = reduce(lambda x,y: x+y, extracted.as_span(), []) # all spans in one list
+    extracted_sents = extract_sentence(doc)
+    spans = [span for extracted in extracted_sents for spans in extracted.as_span() for span in spans] # all spans of all sentences in one list
     doc.spans['sc'] = spans # create a new span group in the doc
-    doc._.extracted = extracted # store the extracted sentence in the doc
+    doc._.extracted_sents = extracted_sents # store the extracted sentences in the doc
+    doc._.extracted = extracted_sents[0] if extracted_sents else None # the first sentence, for docs with one sentence
+    doc._.doc_index = None # the index of the tokens is only needed during the extraction
     return doc
 
 # for Prodigy to find the span group name
@@ -0,0 +1,230 @@
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+
+end = object() # marks the end of a stream in a queue
+
+
+def threaded(iterable, maxsize=256, stopped=None, poll=0.1):
+    '''
+    iterates over iterable in its own thread (e.g. reading a corpus) and yields its items, at most maxsize items ahead;
+    stopped: Event that stops the thread early, e.g. when the consumer failed and no longer takes the items
+    '''
+    items = queue.Queue(maxsize)
+    errors = []
+    stopped = stopped if stopped is not None else Event()
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=poll)
+                return True
+            except queue.Full:
+                pass
+        return False
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        put(end)
+    Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            try:
+                item = items.get(timeout=poll)
+            except queue.Empty:
+                if stopped.is_set(): # the thread stopped without reading to the end
+                    return
+                continue
+            if item is end:
+                if errors:
+                    raise errors[0]
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+def ordered_map(function, items, workers=4, maxsize=256):
+    '''function of each item, computed by a pool of workers threads with at most maxsize items in progress, in the order of items;
+    the threads share the GIL, so pure Python functions only overlap with waiting (e.g. for the parse or the disk), not with each other'''
+    with ThreadPoolExecutor(workers) as executor:
+        futures = deque()
+        for item in items:
+            futures.append(executor.submit(function, item))
+            if len(futures) >= maxsize:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+def in_order(items, ready, process, max_ready=1024):
+    '''
+    yields (item, result, processed) for each of items, in their order: result is ready(item) if that is not None (e.g. a cached
+    parse), otherwise the result of process, which gets the items that are not ready and yields one result for each, in their order;
+    process (e.g. nlp.pipe) may read ahead to fill a batch, so the ready items behind it are held back: after max_ready of them,
+    process is ended (it finishes its last, smaller batch) and started again for the next items, so that memory stays bounded
+    '''
+    items = iter(items)
+    pending = deque() # (item, result of ready or None) in the order of items, while process runs
+    while True:
+        # the ready items before the first one that is not ready are given back right away, without starting process
+        for item in items:
+            result = ready(item)
+            if result is None:
+                break
+            yield item, result, False
+        else:
+            return
+        pending.append((item, None))
+        def unready_items(first):
+            yield first
+            held_back = 0
+            for item in items:
+                result = ready(item)
+                pending.append((item, result))
+                if result is None:
+                    yield item
+                else:
+                    held_back += 1
+                    if held_back >= max_ready:
+                        return
+        for result in process(unready_items(item)):
+            # all ready items before the processed one can be given back as well
+            while pending[0][1] is not None:
+                yield pending.popleft() + (False,)
+            yield pending.popleft()[0], result, True
+        while pending:
+            yield pending.popleft() + (False,)
+
+
+class Cancelled(Exception):
+    '''raised in the documents that still wait for parses when SharedParser.cancel stops them'''
+
+
+# SharedParser runs one parse function (e.g. parse_documents with the model) in its own thread for the sentences of several documents
+# at once, so that the model is always busy while the documents are read, extracted and written in their own threads
+class SharedParser:
+    def __init__(self, parse, clients, maxsize=256, poll=0.1):
+        '''
+        parse: function that yields (id, sentence, doc) of an iterable of (id, sentence), in their order;
+        clients: number of documents that share the thread, each calls parse as often as it needs and finish when it is done;
+        maxsize: maximum number of sentences that wait for the parse or for their document;
+        poll: seconds between the checks whether a document stopped reading its results or the parse was cancelled
+        '''
+        self.parse_function = parse
+        self.clients = clients
+        self.maxsize = maxsize
+        self.poll = poll
+        self.requests = queue.Queue(maxsize) # (results queue of the parse call, id, sentence) or (results queue, end, error)
+        self.results = set() # results queues of the parse calls that are still read, to stop them on cancel
+        self.closed = set() # results queues of the parse calls that stopped reading them (after an error), their parses are dropped
+        self.finished = 0 # number of documents that called finish
+        self.lock = Lock()
+        self.cancelled = False
+        self.error = None # error of the parse function, raised in all parse calls after it
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def parse(self, sentences):
+        '''same as parse(sentences), but parsed in the shared thread together with the sentences of the other documents'''
+        results = queue.Queue(self.maxsize)
+        self.results.add(results)
+        def feed():
+            error = None
+            try:
+                for id, sentence in sentences:
+                    if not self.request(results, (results, id, sentence)):
+                        return
+            except BaseException as e:
+                error = e
+            self.request(results, (results, end, error))
+        Thread(target=feed, daemon=True).start()
+        try:
+            while True:
+                id, sentence, doc = self.get(results)
+                if id is end:
+                    if sentence is not None:
+                        raise sentence
+                    return
+                yield id, sentence, doc
+        finally:
+            # also when the document stops early (an error while extracting or writing), so that the parse thread does not
+            # wait for it to read its results and block the other documents
+            self.closed.add(results)
+            self.results.discard(results)
+
+    def finish(self):
+        '''called by each document after its last parse (also after an error), the parse thread ends after all clients finished'''
+        with self.lock:
+            self.finished += 1
+
+    def request(self, results, item):
+        '''sends item to the parse thread, unless the document stopped reading the results queue; False if it did'''
+        while results not in self.closed:
+            try:
+                self.requests.put(item, timeout=self.poll)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self, results):
+        while True:
+            try:
+                return results.get(timeout=self.poll)
+            except queue.Empty:
+                if self.error is not None:
+                    raise self.error
+                if self.cancelled:
+                    raise Cancelled('The parse was cancelled because another document failed.')
+
+    def put(self, results, item):
+        '''puts item into the results queue of a document, unless the document stopped reading it'''
+        while results not in self.closed:
+            try:
+                results.put(item, timeout=self.poll)
+                return
+            except queue.Full:
+                pass
+
+    def cancel(self):
+        '''stops the documents that still wait for parses, e.g. after another document failed; they raise Cancelled'''
+        self.cancelled = True
+        self.closed.update(list(self.results))
+
+    def run(self):
+        outstanding = dict() # results queue -> number of its sentences that are in the parse
+        ended = dict() # results queue -> error (or None) of the parse calls that sent all sentences, but still wait for some
+        def shared_sentences():
+            while True:
+                try:
+                    results, id, sentence = self.requests.get(timeout=self.poll)
+                except queue.Empty:
+                    # nothing new to parse: end the stream, so that the parse function finishes its last batch for the parse
+                    # calls that wait for it (e.g. to start their next one), or because all documents are done
+                    if ended or self.finished >= self.clients:
+                        return
+                    continue
+                if id is end:
+                    if outstanding.get(results, 0) == 0:
+                        self.put(results, (end, sentence, None))
+                    else:
+                        ended[results] = sentence
+                    continue
+                outstanding[results] = outstanding.get(results, 0) + 1
+                yield (results, id), sentence
+        try:
+            while self.finished < self.clients:
+                for (results, id), sentence, doc in self.parse_function(shared_sentences()):
+                    self.put(results, (id, sentence, doc))
+                    outstanding[results] -= 1
+                    if outstanding[results] == 0:
+                        del outstanding[results]
+                        if results in ended:
+                            self.put(results, (end, ended.pop(results), None))
+        except BaseException as e:
+            self.error = e
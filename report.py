@@ -0,0 +1,238 @@
+import argparse
+import html
+import os
+from multiprocessing import Pool
+import spacy
+from spacy import displacy
+
+from phrase_extraction import phrase_spans
+from utils import categories, span_colors
+from parse_cache import ParseCache, cache_key
+from corpus import find_corpus, read_sentences
+
+# categories whose empty span group marks a sentence that needs a look
+empty_categories = ['VERB', 'SUBJECT']
+
+dep_options = {'compact': True, 'collapse_phrases': False, 'distance': 110}
+span_options = {'spans_key': phrase_spans.key, 'colors': span_colors}
+
+style = '''body { font-family: sans-serif; margin: 2em; }
+nav a, .filters label { margin-right: 1em; }
+.sentence { border-top: 1px solid #ccc; padding: 1em 0; }
+.sentence h3 { font-size: 1em; margin: 0 0 .5em; }
+.empty { color: #C84361; font-weight: bold; }
+.hidden { display: none; }
+table { border-collapse: collapse; }
+td, th { padding: .2em .8em; text-align: left; border-bottom: 1px solid #eee; }
+details { margin-top: .5em; overflow-x: auto; }
+'''
+
+# shows the .sentence elements (or table rows) that have the chosen category and empty categories, see sentence_attributes
+script = '''function filterSentences() {
+  var category = document.getElementById('category').value;
+  var empty = Array.prototype.map.call(document.querySelectorAll('.filters input:checked'), function (box) { return box.value; });
+  document.querySelectorAll('[data-labels]').forEach(function (element) {
+    var labels = element.dataset.labels.split(' '), emptyLabels = element.dataset.empty.split(' ');
+    var shown = (!category || labels.indexOf(category) >= 0) && empty.every(function (label) { return emptyLabels.indexOf(label) >= 0; });
+    element.classList.toggle('hidden', !shown);
+  });
+}
+document.addEventListener('DOMContentLoaded', function () {
+  document.querySelectorAll('.filters select, .filters input').forEach(function (input) { input.addEventListener('change', filterSentences); });
+});
+'''
+
+
+def choose_fingerprints(models, chosen=None):
+    '''
+    fingerprints of the models whose parses are shown, in the order they are looked up for each sentence;
+    models: fingerprint -> model name and version, of the cache index;
+    chosen: fingerprints (or their beginning) or model names and versions, all models of the cache if there is only one
+    '''
+    if not chosen:
+        if len(models) > 1:
+            raise ValueError('The cache holds parses of several models, choose them with --model:\n' +
+                '\n'.join('  {} {}'.format(fingerprint, name) for fingerprint, name in models.items()))
+        return list(models)
+    fingerprints = []
+    for model in chosen:
+        matches = [fingerprint for fingerprint, name in models.items() if fingerprint.startswith(model) or name == model]
+        if len(matches) != 1:
+            raise ValueError('{} matches {} models of the cache, use its fingerprint instead.'.format(model, len(matches) or 'no'))
+        fingerprints.append(matches[0])
+    return fingerprints
+
+
+def report_sentences(cache, fingerprints, documents):
+    '''
+    the sentences of the documents with the location of their cached parse
+    Output: generator of (document, id, sentence, [shard, position] or None if none of the models parsed it)
+    '''
+    for document in documents:
+        for id, sentence in read_sentences(find_corpus('input', document)):
+            keys = (cache_key(fingerprint, sentence) for fingerprint in fingerprints)
+            yield document, id, sentence, next((cache.entries[key] for key in keys if key in cache.entries), None)
+
+
+def sentence_attributes(doc):
+    '''span categories of the extracted doc and the empty_categories without spans, for filtering'''
+    labels = sorted({span.label_ for span in doc.spans[phrase_spans.key]})
+    empty = [category for category in empty_categories if category not in labels]
+    return labels, empty
+
+
+def render_sentence(number, document, id, doc):
+    '''html of one extracted sentence: the span visualization with span_colors and its dependency tree'''
+    labels, empty = sentence_attributes(doc)
+    flags = ''.join(' <span class="empty">no {}</span>'.format(category) for category in empty)
+    return '''<div class="sentence" id="s{}" data-labels="{}" data-empty="{}">
+<h3>{} {}{}</h3>
+{}
+<details><summary>dependency tree</summary>{}</details>
+</div>
+'''.format(number, ' '.join(labels), ' '.join(empty), html.escape(document), html.escape(id), flags,
+        displacy.render(doc, style='span', options=span_options, page=False, jupyter=False),
+        displacy.render(doc, style='dep', options=dep_options, page=False, jupyter=False))
+
+
+def page_name(page):
+    return 'page_{:04d}.html'.format(page + 1)
+
+
+def filters(labels):
+    '''category menu and empty category check boxes of a page'''
+    options = ''.join('<option>{}</option>'.format(label) for label in labels)
+    boxes = ''.join('<label><input type="checkbox" value="{0}"> no {0}</label>'.format(category) for category in empty_categories)
+    return '<div class="filters"><label>Category <select id="category"><option value="">all</option>{}</select></label>{}</div>\n'.format(options, boxes)
+
+
+def write_page(path, title, body, navigation=''):
+    with open(path, 'w', encoding='utf8') as f:
+        f.write('''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{0}</title><link rel="stylesheet" href="report.css"><script src="report.js"></script></head>
+<body>
+<h1>{0}</h1>
+{1}
+{2}{1}
+</body></html>
+'''.format(html.escape(title), navigation, body))
+
+
+worker_cache = None # ParseCache of a worker process, see start_worker
+worker_vocab = None
+
+
+def start_worker(cache_dir, loaded_shards):
+    global worker_cache, worker_vocab
+    worker_cache = ParseCache(cache_dir, loaded_shards=loaded_shards)
+    worker_vocab = spacy.blank('en').vocab # the cached docs only need a vocab with their strings, not the model
+
+
+def render_page(task):
+    '''
+    renders a page of sentences from their cached parses and writes it into the output folder
+    Input: (output folder, page number, number of pages, [(number, document, id, sentence, [shard, position]), ...])
+    Output: [(number, labels, empty categories), ...] of the sentences of the page, for the index
+    '''
+    output, page, pages, items = task
+    parts, summaries = [], []
+    for number, document, id, sentence, (shard, position) in items:
+        doc = phrase_spans(worker_cache.load_shard(worker_vocab, shard)[position]) # the extraction rules run again, the model does not
+        parts.append(render_sentence(number, document, id, doc))
+        summaries.append((number,) + sentence_attributes(doc))
+    links = ['<a href="index.html">index</a>']
+    if page > 0:
+        links.append('<a href="{}">previous</a>'.format(page_name(page - 1)))
+    if page + 1 < pages:
+        links.append('<a href="{}">next</a>'.format(page_name(page + 1)))
+    navigation = '<nav>{}</nav>\n'.format(' '.join(links))
+    write_page(os.path.join(output, page_name(page)), 'Page {} of {}'.format(page + 1, pages), filters(categories) + ''.join(parts), navigation)
+    return summaries
+
+
+def write_index(output, rows, pages, missing):
+    '''
+    index page with the number of sentences per category and a filterable table of all sentences with links to their page;
+    rows: (number, document, id, page, labels, empty categories) of the rendered sentences;
+    missing: (document, id) of the sentences without a cached parse
+    '''
+    counts = {category: 0 for category in categories + ['no ' + category for category in empty_categories]}
+    for _, _, _, _, labels, empty in rows:
+        for label in labels:
+            counts[label] = counts.get(label, 0) + 1
+        for category in empty:
+            counts['no ' + category] += 1
+    body = '<p>{} sentences on {} pages, {} sentences without a cached parse.</p>\n'.format(len(rows), pages, len(missing))
+    body += '<p>{}</p>\n'.format(' '.join('<a href="{}">{}</a>'.format(page_name(page), page + 1) for page in range(pages)))
+    body += '<table><tr><th>Category</th><th>Sentences</th></tr>{}</table>\n'.format(
+        ''.join('<tr><td>{}</td><td>{}</td></tr>'.format(category, count) for category, count in counts.items()))
+    body += filters(categories)
+    body += '<table><tr><th>Document</th><th>Id</th><th>Categories</th><th></th></tr>\n{}</table>\n'.format(''.join(
+        '<tr data-labels="{}" data-empty="{}"><td>{}</td><td><a href="{}#s{}">{}</a></td><td>{}</td><td class="empty">{}</td></tr>\n'.format(
+            ' '.join(labels), ' '.join(empty), html.escape(document), page_name(page), number, html.escape(id), ' '.join(labels),
+            ' '.join('no ' + category for category in empty))
+        for number, document, id, page, labels, empty in rows))
+    if missing:
+        body += '<h2>Sentences without a cached parse</h2>\n<ul>{}</ul>\n'.format(
+            ''.join('<li>{} {}</li>'.format(html.escape(document), html.escape(id)) for document, id in missing))
+    write_page(os.path.join(output, 'index.html'), 'Extraction report', body)
+
+
+def create_report(cache_dir, output, documents, models=None, page_size=100, processes=None, loaded_shards=8):
+    '''
+    writes the span and dependency visualizations of all sentences of the documents into paginated html files in output,
+    rendered in processes worker processes from the parses in the cache of extract_docs.py --cache-dir, without the model;
+    the workers write the html of their pages themselves and only send back the categories of the sentences for the index
+    '''
+    cache = ParseCache(cache_dir)
+    fingerprints = choose_fingerprints(cache.models, models)
+    os.makedirs(output, exist_ok=True)
+    with open(os.path.join(output, 'report.css'), 'w') as f:
+        f.write(style)
+    with open(os.path.join(output, 'report.js'), 'w') as f:
+        f.write(script)
+    # the sentences are read once to count the pages (for the navigation), the cache index gives their location
+    items, missing = [], []
+    for document, id, sentence, location in report_sentences(cache, fingerprints, documents):
+        if location is None:
+            missing.append((document, id))
+        else:
+            items.append((len(items), document, id, sentence, location))
+    del cache # the workers read the shards themselves
+    pages = (len(items) + page_size - 1) // page_size
+    tasks = ((output, page, pages, items[page * page_size:(page + 1) * page_size]) for page in range(pages))
+    rows = []
+    with Pool(processes, initializer=start_worker, initargs=(cache_dir, loaded_shards)) as pool:
+        for page, summaries in enumerate(pool.imap(render_page, tasks)):
+            for number, labels, empty in summaries:
+                _, document, id, _, _ = items[number]
+                rows.append((number, document, id, page, labels, empty))
+    write_index(output, rows, pages, missing)
+    return len(rows), pages, missing
+
+
+# Create a report of the last run, e.g. python report.py cache --output report
+if __name__ == '__main__':
+    from extract_docs import documents
+    parser = argparse.ArgumentParser(description='Writes the extracted spans and dependency trees of the cached parses of a run into static html pages.')
+    parser.add_argument('cache_dir', help='folder of the parse cache of the run (extract_docs.py --cache-dir)')
+    parser.add_argument('--output', default='report', help='folder to write the html pages into')
+    parser.add_argument('--model', action='append', help='fingerprint (or its beginning) or "name version" of the model whose parses are shown, '
+        'needed if the cache holds several models; repeat it to fall back to another model (e.g. the full and then the fast model of --cascade)')
+    parser.add_argument('--page-size', type=int, default=100, help='number of sentences per page')
+    parser.add_argument('--processes', type=int, help='number of worker processes that render the pages, all cpus by default')
+    args = parser.parse_args()
+    if not os.path.exists(os.path.join(args.cache_dir, 'index.json')):
+        parser.error('{} is not a parse cache, create one with extract_docs.py --cache-dir.'.format(args.cache_dir))
+    if args.page_size < 1:
+        parser.error('--page-size must be at least 1')
+    for folder_name, _ in documents:
+        if find_corpus('input', folder_name) is None:
+            parser.error('no input for {} found, the report reads the sentences from input/ as extract_docs.py does.'.format(folder_name))
+    try:
+        sentences, pages, missing = create_report(args.cache_dir, args.output, [folder_name for folder_name, _ in documents],
+            args.model, args.page_size, args.processes)
+    except ValueError as e:
+        parser.error(str(e))
+    print('Wrote {} sentences on {} pages to {}, {} sentences had no cached parse.'.format(
+        sentences, pages, os.path.join(args.output, 'index.html'), len(missing)))
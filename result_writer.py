@@ -0,0 +1,107 @@
+import csv
+import json
+import os
+
+output_formats = ['csv', 'jsonl', 'parquet']
+
+
+# ResultWriter appends the result rows to a csv, jsonl or parquet file while they are produced, in chunks of chunk_size rows
+# that are collected column by column, so that a parquet chunk is built from the columns without turning rows into columns
+class ResultWriter:
+    def __init__(self, path, columns, output_format='csv', chunk_size=1000):
+        '''
+        path: output file without extension, e.g. result/realization_document;
+        columns: names of the row values, each row is written with its id as the first column
+        '''
+        if output_format not in output_formats:
+            raise ValueError('Unknown output format {}, use one of {}.'.format(output_format, ', '.join(output_formats)))
+        self.path = '{}.{}'.format(path, output_format)
+        # the rows go into a temporary file that replaces the result file at close, so that the result file of the previous run
+        # can be read while this one is written (see Manifest) and an interrupted run keeps it
+        self.temporary_path = self.path + '.tmp'
+        self.columns = columns
+        self.output_format = output_format
+        self.chunk_size = chunk_size
+        self.values = [[] for _ in ['id'] + columns] # buffered values of each column, the id first
+        self.parquet_writer = None
+        if output_format == 'parquet':
+            self.file = None
+        else:
+            self.file = open(self.temporary_path, 'w', newline='' if output_format == 'csv' else None)
+        if output_format == 'csv':
+            self.csv_writer = csv.writer(self.file)
+            self.csv_writer.writerow(['id'] + columns)
+
+    def write(self, id, row):
+        for values, value in zip(self.values, [id] + list(row)):
+            values.append(value)
+        if len(self.values[0]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        '''writes the buffered rows, so that they are on disk even if the run stops afterwards'''
+        if not self.values[0]:
+            return
+        columns, self.values = self.values, [[] for _ in self.values]
+        if self.output_format == 'csv':
+            self.csv_writer.writerows(zip(*columns))
+        elif self.output_format == 'jsonl':
+            names = ['id'] + self.columns
+            for row in zip(*columns):
+                self.file.write(json.dumps(dict(zip(names, row))) + '\n')
+        else:
+            self.write_parquet_chunk(columns)
+        if self.file is not None:
+            self.file.flush()
+
+    def write_parquet_chunk(self, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.table({name: pa.array(values) for name, values in zip(['id'] + self.columns, columns)})
+        if self.parquet_writer is None:
+            self.parquet_writer = pq.ParquetWriter(self.temporary_path, table.schema)
+        self.parquet_writer.write_table(table.cast(self.parquet_writer.schema))
+
+    def close(self):
+        self.flush()
+        if self.output_format == 'parquet' and self.parquet_writer is None: # no rows at all, still write the columns
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.table({column: pa.array([], pa.string()) for column in ['id'] + self.columns}), self.temporary_path)
+        if self.file is not None:
+            self.file.close()
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        os.replace(self.temporary_path, self.path)
+
+    def to_excel(self):
+        '''converts the finished output file into an .xlsx file next to it'''
+        import pandas as pd
+        if self.output_format == 'csv':
+            df = pd.read_csv(self.path, index_col='id', dtype={'id': str}, keep_default_na=False)
+        elif self.output_format == 'jsonl':
+            df = pd.read_json(self.path, lines=True, dtype={'id': str}).set_index('id')
+        else:
+            df = pd.read_parquet(self.path).set_index('id')
+        df.to_excel(os.path.splitext(self.path)[0] + '.xlsx')
+
+
+def read_results(path):
+    '''lazily reads the (id, row) pairs of a result file written by ResultWriter'''
+    if path.endswith('.csv'):
+        with open(path, 'r', newline='') as f:
+            records = csv.reader(f)
+            next(records, None) # the column names
+            for record in records:
+                yield record[0], record[1:]
+    elif path.endswith('.jsonl'):
+        with open(path, 'r') as f:
+            for line in f:
+                values = list(json.loads(line).values())
+                yield values[0], values[1:]
+    else:
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches():
+            for record in batch.to_pylist():
+                values = list(record.values())
+                yield values[0], values[1:]
@@ -0,0 +1,77 @@
+from itertools import islice
+
+
+def estimated_length(text):
+    '''number of words of a sentence, as an estimate of its number of tokens before it is parsed'''
+    return len(text.split())
+
+
+# LengthScheduler sorts the sentences by length within a window before nlp.pipe, so that a batch holds sentences of similar length
+# and the transformer spends less time on padding; the docs are given back in the original order
+class LengthScheduler:
+    def __init__(self, token_budget=4096, window=2048):
+        '''
+        token_budget: maximum number of padded tokens of a batch (its number of sentences times its longest sentence);
+        window: number of sentences that are read ahead and sorted together
+        '''
+        self.token_budget = token_budget
+        self.window = window
+        self.batches = 0
+        self.tokens = 0 # estimated tokens of the sentences
+        self.padded_tokens = 0 # estimated tokens including the padding to the longest sentence of each batch
+        self.unsorted_padded_tokens = 0 # the same for batches of batch_size sentences in the input order, for comparison
+
+    def batches_of(self, order, lengths, batch_size):
+        '''splits the sorted positions order into batches of at most batch_size sentences and token_budget padded tokens'''
+        batch = []
+        for i in order:
+            if batch and (len(batch) >= batch_size or (len(batch) + 1) * max(lengths[batch[-1]], lengths[i]) > self.token_budget):
+                yield batch
+                batch = []
+            batch.append(i)
+        if batch:
+            yield batch
+
+    def count(self, batch, lengths):
+        self.batches += 1
+        self.tokens += sum(lengths[i] for i in batch)
+        self.padded_tokens += len(batch) * max(lengths[i] for i in batch)
+
+    def count_unsorted(self, lengths):
+        '''counts the padding of a batch that nlp.pipe would make without sorting, for comparison'''
+        self.unsorted_padded_tokens += len(lengths) * max(lengths)
+
+    def pipe(self, nlp, texts, batch_size=64, n_process=1, disable=[]):
+        '''
+        same as nlp.pipe(texts), but with batches of sentences of similar length of at most batch_size sentences and
+        token_budget padded tokens; only for n_process=1, because nlp.pipe with several processes only takes one batch size
+        '''
+        if n_process != 1:
+            raise ValueError('LengthScheduler needs n_process=1, nlp.pipe with several processes cannot limit the batches to the token budget.')
+        texts = iter(texts)
+        unsorted = [] # lengths of the unsorted batch that is not full yet, unsorted batches have batch_size sentences across the windows
+        while True:
+            window = list(islice(texts, self.window))
+            if not window:
+                if unsorted:
+                    self.count_unsorted(unsorted)
+                return
+            lengths = [estimated_length(text) for text in window]
+            order = sorted(range(len(window)), key=lambda i: lengths[i])
+            for length in lengths:
+                unsorted.append(length)
+                if len(unsorted) == batch_size:
+                    self.count_unsorted(unsorted)
+                    unsorted = []
+            docs = [None] * len(window)
+            for batch in self.batches_of(order, lengths, batch_size):
+                self.count(batch, lengths)
+                for i, doc in zip(batch, nlp.pipe([window[i] for i in batch], batch_size=len(batch), disable=disable)):
+                    docs[i] = doc
+            yield from docs
+
+    def report(self):
+        efficiency = self.tokens / self.padded_tokens if self.padded_tokens else 1
+        unsorted_efficiency = self.tokens / self.unsorted_padded_tokens if self.unsorted_padded_tokens else 1
+        return 'Padding efficiency {:.1%} in {} batches ({} of {} padded tokens are words of the sentences), {:.1%} without sorting.'.format(
+            efficiency, self.batches, self.tokens, self.padded_tokens, unsorted_efficiency)
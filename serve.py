@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from string import punctuation, whitespace
+import spacy
+
+from phrase_extraction import *
+from utils import categories, get_extracted_sents, span_texts
+
+reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+def doc_result(sentence, doc):
+    '''JSON result of one parsed sentence (or section): the merged text of each span category and the as_row() of every extracted sentence'''
+    texts = span_texts(doc, punctuation + whitespace)
+    return {
+        'sentence': sentence,
+        'spans': {category: ' '.join(texts[category]) for category in categories},
+        'rows': [list(extracted.as_row()) for extracted in get_extracted_sents(doc)],
+    }
+
+
+# MicroBatcher collects the sentences of concurrent requests into batches for nlp.pipe
+class MicroBatcher:
+    def __init__(self, nlp, max_batch=64, max_latency=0.01, max_queue=1024):
+        '''
+        max_batch: maximum number of sentences per nlp.pipe call;
+        max_latency: seconds to wait for more sentences after the first one of a batch arrived;
+        max_queue: maximum number of waiting sentences, requests wait for free places when the queue is full
+        '''
+        self.nlp = nlp
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.queue = asyncio.Queue(max_queue)
+        self.executor = ThreadPoolExecutor(1) # the model is only used by one thread
+        self.batches = 0
+        self.sentences = 0
+
+    async def extract(self, sentences):
+        '''results of the sentences, in their order'''
+        loop = asyncio.get_running_loop()
+        futures = []
+        for sentence in sentences:
+            future = loop.create_future()
+            await self.queue.put((sentence, future)) # waits while the queue is full (backpressure)
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    def parse(self, sentences):
+        '''results of the sentences; if the batch fails, the sentences are parsed again one by one and the error of a failing
+        sentence takes its place, so that only its request fails and not the other requests of the batch'''
+        try:
+            return [doc_result(sentence, doc) for sentence, doc in zip(sentences, self.nlp.pipe(sentences, batch_size=len(sentences)))]
+        except Exception:
+            if len(sentences) == 1:
+                raise
+        results = []
+        for sentence in sentences:
+            try:
+                results.append(doc_result(sentence, self.nlp(sentence)))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def next_batch(self):
+        '''waits for a first sentence, then for more until the batch is full or max_latency has passed'''
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_latency
+        while len(batch) < self.max_batch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.next_batch()
+            sentences = [sentence for sentence, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.parse, sentences)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.sentences += len(batch)
+            for (_, future), result in zip(batch, results):
+                if future.done(): # the client may have disconnected
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+# ExtractionServer answers HTTP requests on localhost or a Unix socket:
+#   POST /extract {"text": "..."} -> result of the sentence
+#   POST /extract {"sentences": ["...", ...]} -> {"results": [...]}
+#   GET /health -> model name and number of parsed batches and sentences
+class ExtractionServer:
+    def __init__(self, nlp, batcher):
+        self.nlp = nlp
+        self.batcher = batcher
+
+    async def handle(self, method, path, body):
+        '''status and JSON response of one request'''
+        if path == '/health':
+            return 200, {'status': 'ok', 'model': '{} {}'.format(self.nlp.meta.get('name'), self.nlp.meta.get('version')),
+                'batches': self.batcher.batches, 'sentences': self.batcher.sentences, 'queued': self.batcher.queue.qsize()}
+        if path != '/extract':
+            return 404, {'error': 'Unknown path {}, use /extract or /health.'.format(path)}
+        if method != 'POST':
+            return 405, {'error': 'Use POST for /extract.'}
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError as e:
+            return 400, {'error': 'Invalid JSON: {}'.format(e)}
+        if isinstance(request, dict) and isinstance(request.get('text'), str):
+            return 200, (await self.batcher.extract([request['text']]))[0]
+        if isinstance(request, dict) and isinstance(request.get('sentences'), list) and all(isinstance(s, str) for s in request['sentences']):
+            return 200, {'results': await self.batcher.extract(request['sentences'])}
+        return 400, {'error': 'Send {"text": "..."} or {"sentences": ["...", ...]}.'}
+
+    async def serve_connection(self, reader, writer):
+        '''reads HTTP/1.1 requests of one connection until the client closes it'''
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, version = request_line.decode('latin-1').split(' ', 2)
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                try:
+                    status, response = await self.handle(method, path.split('?')[0], body)
+                except Exception as e:
+                    status, response = 500, {'error': str(e)}
+                data = json.dumps(response).encode('utf-8')
+                keep_alive = version.strip() == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+                    status, reasons[status], len(data), 'keep-alive' if keep_alive else 'close').encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass # malformed request or the client went away
+        finally:
+            writer.close()
+
+
+async def serve(nlp, host='127.0.0.1', port=8080, socket_path=None, max_batch=64, max_latency=0.01, max_queue=1024):
+    batcher = MicroBatcher(nlp, max_batch, max_latency, max_queue)
+    server = ExtractionServer(nlp, batcher)
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        listener = await asyncio.start_unix_server(server.serve_connection, socket_path)
+        print('Serving on unix socket {}'.format(socket_path))
+    else:
+        listener = await asyncio.start_server(server.serve_connection, host, port)
+        print('Serving on http://{}:{}'.format(host, port))
+    batching = asyncio.create_task(batcher.run())
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        batching.cancel()
+        batcher.executor.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Loads the model once and serves the phrase extraction over HTTP on localhost or a Unix socket.')
+    parser.add_argument('model', help='path to the spacy model that will extract the spans')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on')
+    parser.add_argument('--socket', help='listen on this Unix socket instead of host and port')
+    parser.add_argument('--max-batch', type=int, default=64, help='maximum number of sentences the model parses at once')
+    parser.add_argument('--max-latency', type=float, default=10, help='milliseconds to wait for more sentences before a batch is parsed')
+    parser.add_argument('--max-queue', type=int, default=1024, help='maximum number of waiting sentences before requests have to wait')
+    args = parser.parse_args()
+    nlp = spacy.load(args.model)
+    try:
+        asyncio.run(serve(nlp, args.host, args.port, args.socket, args.max_batch, args.max_latency / 1000, args.max_queue))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,69 @@
+import random
+
+import spacy
+from spacy.tokens import Doc
+
+from utils import expand_subtree, subtree_has_trigger, condition_trigger
+
+nlp = spacy.blank('en')
+
+
+def make_doc(heads):
+    deps = ['ROOT' if head == i else 'dep' for i, head in enumerate(heads)]
+    return Doc(nlp.vocab, words=['w{}'.format(i) for i in range(len(heads))], heads=heads, deps=deps)
+
+
+def random_heads(length, rng):
+    '''heads of a random tree, attached in a random order, so that most trees are non-projective'''
+    order = list(range(length))
+    rng.shuffle(order)
+    heads = [0] * length
+    heads[order[0]] = order[0]
+    for position, i in enumerate(order[1:], 1):
+        heads[i] = order[rng.randrange(position)]
+    return heads
+
+
+def projective_heads(length, rng):
+    '''heads of a random projective tree: every range of tokens has a root, whose left and right ranges are attached to it'''
+    heads = [0] * length
+    ranges = [(0, length, None)] # (start, end, head of the root of the range)
+    while ranges:
+        start, end, head = ranges.pop()
+        if start < end:
+            root = rng.randrange(start, end)
+            heads[root] = root if head is None else head
+            ranges += [(start, root, root), (root + 1, end, root)]
+    return heads
+
+
+def assert_subtrees(doc):
+    for token in doc:
+        assert [t.i for t in expand_subtree(token)] == sorted(t.i for t in token.subtree)
+
+
+def test_non_projective_subtree():
+    # the subtree of token 0 is 0, 2, 3 and 4, but spaCy's right_edge of token 0 is 3
+    doc = make_doc([1, 1, 3, 0, 2])
+    assert [t.i for t in expand_subtree(doc[0])] == [0, 2, 3, 4]
+    assert_subtrees(doc)
+
+
+def test_random_trees():
+    rng = random.Random(0)
+    for _ in range(500):
+        assert_subtrees(make_doc(random_heads(rng.randint(1, 12), rng)))
+
+
+def test_subtree_has_trigger():
+    # words that form triggers only together (as long as) or inside each other (at least, least), with and without spaces
+    words = ['as', 'long', 'At', 'least', 'no', 'later', 'than', 'if', 'report', 'unless']
+    rng = random.Random(0)
+    for n in range(1000):
+        heads = (random_heads if n % 2 else projective_heads)(rng.randint(1, 12), rng)
+        doc = Doc(nlp.vocab, words=[rng.choice(words) for _ in heads], spaces=[rng.random() < 0.8 for _ in heads],
+            heads=heads, deps=['ROOT' if head == i else 'dep' for i, head in enumerate(heads)])
+        for token in doc:
+            text = ''.join(t.text_with_ws for t in sorted(token.subtree, key=lambda t: t.i)).lower()
+            for triggers in [condition_trigger, ['least', 'at least'], []]:
+                assert subtree_has_trigger(token, triggers) == any(trigger in text for trigger in triggers)
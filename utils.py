@@ -1,7 +1,8 @@
-from functools import reduce
-from itertools import groupby
+import re
+import srsly
+from array import array
+from itertools import accumulate, groupby
 from spacy.tokens import Span, Doc
-from spacy import displacy
 
 # annotation labels of spans
 categories = ['SUBJECT', 'SIGNAL', 'VERB', 'TIME', 'CONDITION', 'OBJECT', 'OP_SUBJECT', 'OP_SIGNAL', 'OP_VERB', 'OP_TIME', 'OP_CONDITION', 'OP_OBJECT']
@@ -54,37 +55,35 @@ class Phrase:
         return ' | '.join([str(phrase) for phrase in phrases])
 
     def merge(phrases):
-        if phrases is None:
+        '''all phrases as one phrase, the tokens are collected in one list instead of adding the phrases one by one'''
+        if phrases is None or len(phrases) == 0:
             return Phrase([])
-        return reduce(lambda x, y: x+y, phrases, Phrase([]))
+        tokens = []
+        for phrase in phrases:
+            if phrase is None: # like Phrase + None, which drops the phrases before
+                tokens = []
+            else:
+                tokens.extend(phrase.tokens)
+        return Phrase(tokens, has_skips=True)
 
     def get_children(self, as_set=False):
         '''children of a phrase are all of their individual children minus their own inner chunk'''
-        all_children = set()
-        for token in self.tokens:
-            all_children |= set(token.children)
-        
-        all_children -= set(self.tokens)
-        if not as_set:
-            all_children = list(all_children)
-            all_children.sort(key=by_index)
-        return all_children
+        if not self.tokens:
+            return set() if as_set else []
+        index = doc_index(self.tokens[0].doc)
+        own = set(t.i for t in self.tokens)
+        all_children = set(child for i in own for child in index.children[i]) - own
+        if as_set:
+            return set(index.tokens[i] for i in all_children)
+        return [index.tokens[i] for i in sorted(all_children)]
 
     def has_trigger(self, triggers):
-        string = self.as_str()
-        for t in triggers:
-            # check if it's in the string
-            if string.find(t) != -1:
-                return True
-        return False
+        # check if any trigger is in the string
+        return compile_triggers(triggers).search(self.as_str()) is not None
 
     def starts_with_trigger(self, triggers):
-        string = self.as_str()
-        for t in triggers:
-            # check if it's at the front of the string
-            if string.find(t) == 0:
-                return True
-        return False
+        # check if any trigger is at the front of the string
+        return compile_triggers(triggers).match(self.as_str()) is not None
     
     def __getitem__(self, key):
         return self.tokens[key]
@@ -100,10 +99,10 @@ class Phrase:
     
     def __sub__(self, other):
         if type(other) is Phrase:
-            blacklist = set(other.tokens)
-            return Phrase([t for t in self.tokens if t not in blacklist], has_skips=True)
+            blacklist = set(t.i for t in other.tokens)
+            return Phrase([t for t in self.tokens if t.i not in blacklist], has_skips=True)
         else: #type(other) is Token:
-            return Phrase([t for t in self.tokens if t != other], has_skips=True)
+            return Phrase([t for t in self.tokens if t.i != other.i], has_skips=True)
 
 
 # Extracted contains the extracted subject phrases, verb phrases, etc.
@@ -194,14 +193,145 @@ class Extracted:
 
         print(f'Subjects: {subjs}\nSignal: {signal}\nVerb: {verb}\nTime: {times}\nCondition: {conds}\nObject: {op}\nOP Subject: {op_subj}\nOP Signal: {op_signal}\nOP Verb: {op_verb}\nOP Time: {op_time}\nOP Condition: {op_cond}\nOP Obj: {op_obj}')
         if display_tree:
+            from spacy import displacy # only needed for rendering
             displacy.render(self.whole_phrase[0].doc, style="dep", options={"compact": False, "bg": "#09a3d5",
            "color": "white", "font": "Source Sans Pro",
            "collapse_phrases": True})
 
 
+# CompactExtracted stores an Extracted as token index ranges instead of spaCy tokens, so it can be pickled or serialized with its doc
+class CompactExtracted:
+    __slots__ = ('starts', 'ends', 'offsets', 'roots', 'skips', 'nodes')
+
+    def __init__(self, extracted=None):
+        '''
+        starts, ends: token index ranges [start, end), the tokens of a phrase are the concatenation of its ranges;
+        offsets: the ranges of phrase p are starts[offsets[p]:offsets[p+1]];
+        roots, skips: root token index (or -1) and has_skips of each phrase;
+        nodes: one [whole_phrase, subject_phrases, signal_word, verb_phrase, times, conditions, objects] per Extracted (nodes[0] is the top one),
+        with phrase numbers instead of phrases and -(n+1) for objects that are nodes[n]
+        '''
+        self.starts, self.ends, self.offsets = array('i'), array('i'), array('i', [0])
+        self.roots, self.skips = array('i'), array('b')
+        self.nodes = []
+        if extracted is not None:
+            self.add_node(extracted, dict())
+
+    def add_phrase(self, phrase, numbers):
+        if phrase is None:
+            return None
+        if id(phrase) not in numbers:
+            numbers[id(phrase)] = len(self.roots)
+            for i in (t.i for t in phrase.tokens):
+                if len(self.starts) > self.offsets[-1] and self.ends[-1] == i:
+                    self.ends[-1] += 1
+                else:
+                    self.starts.append(i)
+                    self.ends.append(i + 1)
+            self.offsets.append(len(self.starts))
+            self.roots.append(phrase.root.i if phrase.root is not None else -1)
+            self.skips.append(phrase.has_skips)
+        return numbers[id(phrase)]
+
+    def add_phrases(self, phrases, numbers):
+        return [self.add_phrase(phrase, numbers) for phrase in phrases] if phrases is not None else None
+
+    def add_node(self, extracted, numbers):
+        n, node = len(self.nodes), [None] * 7
+        self.nodes.append(node)
+        node[:6] = [self.add_phrase(extracted.whole_phrase, numbers), self.add_phrases(extracted.subject_phrases, numbers),
+            self.add_phrase(extracted.signal_word, numbers), self.add_phrase(extracted.verb_phrase, numbers),
+            self.add_phrases(extracted.times, numbers), self.add_phrases(extracted.conditions, numbers)]
+        if extracted.objects is not None:
+            node[6] = [-(self.add_node(obj, numbers) + 1) if type(obj) is Extracted else self.add_phrase(obj, numbers) for obj in extracted.objects]
+        return n
+
+    def to_extracted(self, doc):
+        '''rehydrates the Extracted with Phrase objects of the tokens in doc'''
+        phrases = []
+        for p in range(len(self.roots)):
+            tokens = [doc[i] for r in range(self.offsets[p], self.offsets[p+1]) for i in range(self.starts[r], self.ends[r])]
+            phrase = Phrase(tokens, has_skips=bool(self.skips[p]))
+            phrase.root = doc[self.roots[p]] if self.roots[p] != -1 else None
+            phrases.append(phrase)
+        def phrase(p):
+            return phrases[p] if p is not None else None
+        def phrase_list(ps):
+            return [phrases[p] for p in ps] if ps is not None else None
+        def node(n):
+            whole, subjs, signal, verb, times, conds, objects = self.nodes[n]
+            if objects is not None:
+                objects = [node(-o - 1) if o < 0 else phrases[o] for o in objects]
+            return Extracted(phrase(whole), phrase_list(subjs), phrase(signal), phrase(verb), phrase_list(times), phrase_list(conds), objects)
+        return node(0)
+
+    def to_bytes(self):
+        return srsly.msgpack_dumps({'starts': self.starts.tobytes(), 'ends': self.ends.tobytes(), 'offsets': self.offsets.tobytes(),
+            'roots': self.roots.tobytes(), 'skips': self.skips.tobytes(), 'nodes': self.nodes})
+
+    def from_bytes(self, bytes_data):
+        data = srsly.msgpack_loads(bytes_data)
+        for name, typecode in [('starts', 'i'), ('ends', 'i'), ('offsets', 'i'), ('roots', 'i'), ('skips', 'b')]:
+            values = array(typecode)
+            values.frombytes(data[name])
+            setattr(self, name, values)
+        self.nodes = data['nodes']
+        return self
+
+
+# Extracted objects in doc._.extracted are serialized as CompactExtracted, e.g. by DocBin or nlp.pipe with n_process > 1
+# (a leftover DocIndex is not serialized, it is rebuilt when needed)
+@srsly.msgpack_encoders('extracted')
+def serialize_extracted(obj, chain=None):
+    if type(obj) is Extracted:
+        return {'__compact_extracted__': CompactExtracted(obj).to_bytes()}
+    if type(obj) is DocIndex:
+        return None
+    return obj if chain is None else chain(obj)
+
+@srsly.msgpack_decoders('extracted')
+def deserialize_extracted(obj, chain=None):
+    if '__compact_extracted__' in obj:
+        return CompactExtracted().from_bytes(obj['__compact_extracted__'])
+    return obj if chain is None else chain(obj)
+
+def get_extracted(doc):
+    '''doc._.extracted as Extracted, it is rehydrated (once) if the doc was deserialized and only holds a CompactExtracted'''
+    if type(doc._.extracted) is CompactExtracted:
+        doc._.extracted = doc._.extracted.to_extracted(doc)
+    return doc._.extracted
+
+def get_extracted_sents(doc):
+    '''doc._.extracted_sents as list of Extracted (one per sentence), rehydrated like get_extracted'''
+    if doc._.extracted_sents is not None and any(type(e) is CompactExtracted for e in doc._.extracted_sents):
+        doc._.extracted_sents = [e.to_extracted(doc) if type(e) is CompactExtracted else e for e in doc._.extracted_sents]
+    return doc._.extracted_sents
+
+
 # helper functions
+# each trigger list compiled into one regular expression, so that a phrase is scanned once instead of once per trigger
+trigger_patterns = dict()
+
+def compile_triggers(triggers):
+    '''regular expression that matches any of the triggers anywhere in a string (like str.find, also inside words)'''
+    key = tuple(triggers)
+    if key not in trigger_patterns:
+        trigger_patterns[key] = re.compile('|'.join(re.escape(t) for t in triggers)) if triggers else re.compile('(?!)')
+    return trigger_patterns[key]
+
+# the same trigger lists as lookaheads, so that every position where a trigger starts is found, also where they overlap
+trigger_start_patterns = dict()
+
+def compile_trigger_starts(triggers):
+    '''regular expression that matches (empty) where any of the triggers starts, group 1 is the shortest trigger there'''
+    key = tuple(triggers)
+    if key not in trigger_start_patterns:
+        alternatives = sorted(set(re.escape(t) for t in triggers), key=len)
+        trigger_start_patterns[key] = re.compile('(?=(' + '|'.join(alternatives) + '))') if triggers else re.compile('(?!)')
+    return trigger_start_patterns[key]
+
 def by_depth(token):
-    return depth_of[token]
+    return token.doc._.depths[token.i]
 
 def by_index(token):
     return token.i
@@ -216,22 +346,133 @@ def find_root(doc):
         if token.dep_.lower() in ['root']:
             return token
 
+def sentences_of(doc):
+    '''the sentences of a doc, or the whole doc as one sentence if it has no sentence boundaries'''
+    if doc.has_annotation('SENT_START') or doc.has_annotation('DEP'):
+        return list(doc.sents)
+    return [doc[:]]
+
 def tokens_with_dep(tokens, deps):
     return [t for t in tokens if t.dep_ in deps]
 
-def expand_subtree(token):
-    tokens = [child for child in token.subtree]
-    tokens.sort(key=by_index) # sort in the order of appearance in the sentence
-    return tokens
+def tokens_in_category(doc, category):
+    '''all tokens of the spans with the label category in an already extracted doc'''
+    return [t for span in doc.spans['sc'] if span.label_ == category for t in span]
 
-# depth of each token in the dependency tree (e.g. depth_of[root] = 0)
-depth_of = dict()
+def span_texts(doc, strip=''):
+    '''category -> texts of its spans in an already extracted doc, collected by label because the spans of a category
+    are not next to each other when the doc has several sentences'''
+    texts = {category: [] for category in categories}
+    for span in doc.spans['sc']:
+        texts.setdefault(span.label_, []).append(span.text.strip(strip))
+    return texts
+
+def count_deps_in_category(doc, category, deps):
+    '''number of tokens with one of the dependencies deps in the spans of a category, e.g. negations of the verb'''
+    return len(tokens_with_dep(tokens_in_category(doc, category), deps))
+
+def expand_subtree(token):
+    return doc_index(token.doc).subtree(token.i) # sorted in the order of appearance in the sentence
+
+
+# DocIndex holds the tokens, children and subtrees of a doc, computed once per doc instead of for every Phrase
+class DocIndex:
+    def __init__(self, doc):
+        self.tokens = list(doc)
+        heads = [t.head.i for t in self.tokens]
+        self.children = [[] for _ in self.tokens] # token indices of the children of each token
+        for i, head in enumerate(heads):
+            if head != i:
+                self.children[head].append(i)
+        # subtree sizes and edges, added up from the leaves in the reverse order of a breadth first walk from the roots
+        # (not token.left_edge and token.right_edge, which spaCy gets wrong for non-projective trees)
+        order = [i for i, head in enumerate(heads) if head == i]
+        for i in order:
+            order.extend(self.children[i])
+        self.sizes = [1] * len(self.tokens)
+        self.left_edges = list(range(len(self.tokens)))
+        self.right_edges = list(range(len(self.tokens)))
+        for i in reversed(order):
+            head = heads[i]
+            if head != i:
+                self.sizes[head] += self.sizes[i]
+                self.left_edges[head] = min(self.left_edges[head], self.left_edges[i])
+                self.right_edges[head] = max(self.right_edges[head], self.right_edges[i])
+        self.gapped_subtrees = dict() # token index -> sorted indices of its subtree, for non-projective subtrees
+        self.trigger_checks = dict() # (token index, trigger pattern) -> whether the text of a non-projective subtree contains a trigger
+        self.trigger_ends = dict() # trigger pattern -> for each character of the lowercased text, the end of the first trigger that lies after it
+        self.text = None # lowercased text of the doc, with the character offsets where each token starts and ends (with its whitespace)
+
+    def subtree(self, i):
+        '''new list of the tokens in the subtree of token i, in the order of the sentence'''
+        left, right = self.left_edges[i], self.right_edges[i]
+        if self.sizes[i] == right - left + 1: # the subtree is the whole range between its edges
+            return self.tokens[left:right+1]
+        if i not in self.gapped_subtrees:
+            subtree = [i]
+            for j in subtree:
+                subtree.extend(self.children[j])
+            self.gapped_subtrees[i] = sorted(subtree)
+        return [self.tokens[j] for j in self.gapped_subtrees[i]]
+
+    def subtree_has_trigger(self, i, triggers):
+        '''same as Phrase(token i).has_trigger(triggers): the triggers are plain strings, so the text of a subtree without gaps
+        contains one if a trigger of the whole text lies within its characters, which takes one scan of the text per trigger list'''
+        left, right = self.left_edges[i], self.right_edges[i]
+        if self.sizes[i] == right - left + 1:
+            if self.text is None:
+                texts = [t.text_with_ws.lower() for t in self.tokens]
+                self.text = ''.join(texts)
+                self.ends = list(accumulate(len(text) for text in texts))
+                self.starts = [end - len(text) for end, text in zip(self.ends, texts)]
+            return self.first_trigger_ends(triggers)[self.starts[left]] <= self.ends[right]
+        pattern = compile_triggers(triggers)
+        if (i, pattern) not in self.trigger_checks:
+            text = ''.join([t.text_with_ws for t in self.subtree(i)]).lower()
+            self.trigger_checks[(i, pattern)] = pattern.search(text) is not None
+        return self.trigger_checks[(i, pattern)]
+
+    def first_trigger_ends(self, triggers):
+        pattern = compile_trigger_starts(triggers)
+        if pattern not in self.trigger_ends:
+            ends = [len(self.text) + 1] * (len(self.text) + 1) # no trigger
+            for match in pattern.finditer(self.text):
+                ends[match.start()] = match.end(1)
+            for position in reversed(range(len(self.text))):
+                ends[position] = min(ends[position], ends[position + 1])
+            self.trigger_ends[pattern] = ends
+        return self.trigger_ends[pattern]
+
+# the DocIndex of the doc during the extraction, phrase_spans removes it again afterwards
+Doc.set_extension('doc_index', default=None)
+
+def doc_index(doc):
+    if doc._.doc_index is None:
+        doc._.doc_index = DocIndex(doc)
+    return doc._.doc_index
+
+def children_of(token):
+    '''same as list(token.children), from the DocIndex instead of a scan over the subtree of token'''
+    index = doc_index(token.doc)
+    return [index.tokens[i] for i in index.children[token.i]]
+
+def subtree_has_trigger(token, triggers):
+    return doc_index(token.doc).subtree_has_trigger(token.i, triggers)
+
+# depth of each token in the dependency tree, stored in its own doc and indexed by token.i (e.g. doc._.depths[root.i] = 0)
+Doc.set_extension('depths', default=None)
 
 def assign_depth(token, current_depth=0):
-    depth_of[token] = current_depth
-    # assign the next depth to all of my children recursively
-    for child in token.children:
-        assign_depth(child, current_depth+1)
+    doc = token.doc
+    if doc._.depths is None:
+        doc._.depths = [0] * len(doc)
+    depths = doc._.depths
+    # assign the next depth to all of my children, with a stack instead of recursion for deep trees
+    stack = [(token, current_depth)]
+    while stack:
+        token, current_depth = stack.pop()
+        depths[token.i] = current_depth
+        stack.extend((child, current_depth+1) for child in children_of(token))
 
 # find the last occurrence of a substring in a string
 def last_pos_of(string, substrings):